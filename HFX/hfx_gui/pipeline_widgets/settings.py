@@ -27,6 +27,7 @@ class Applications(HFX.Tree):
         # grab the settings.db
         self._settingsDB = HFX.getDB('settings')
         self._applications = self._settingsDB.table('Applications')
+        self._applications.create_index('type')
 
         # context functions
         self.addFunction('+', self.addApplication)
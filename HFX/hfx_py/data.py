@@ -7,6 +7,7 @@ Back end is tinydb
 import tinydb
 
 # python imports
+import atexit
 from os.path import basename
 from tempfile import NamedTemporaryFile
 
@@ -15,7 +16,8 @@ __all__ = [
     'StaticDB',
     'TransientDB',
     'getDB',
-    'getAll'
+    'getAll',
+    'flushAll'
 ]
 
 
@@ -27,13 +29,14 @@ class _db(tinydb.TinyDB):
     """
     --private--
     """
-    def __init__(self, name, location):
+    def __init__(self, name, location, **kwargs):
         """
-        Load or create a db at the location in question.
+        Load or create a db at the location in question. Extra keyword arguments are handed to tinydb.TinyDB.
         :param location:
+        :param kwargs:
         :return:
         """
-        super(_db, self).__init__(location)
+        super(_db, self).__init__(location, **kwargs)
 
         self._name = name
 
@@ -105,19 +108,21 @@ class _db(tinydb.TinyDB):
 
 class StaticDB(_db):
     """
-    This creates a database that is saved to a location on disk.
+    This creates a database that is saved to a location on disk. Several sessions can open the same db, writes are
+    locked and the changes of the other sessions are read when the tables are used next.
     """
-    def __init__(self, name, location):
+    def __init__(self, name, location, **kwargs):
         """
         Create a fixed database at the provided location.
         :param location:
+        :param kwargs:
         :return:
         """
         # correct location name
         if not name.endswith('.db'):
             name += '.db'
 
-        super(StaticDB, self).__init__(name, location + '/' + name)
+        super(StaticDB, self).__init__(name, location + '/' + name, **kwargs)
 
 
 class TransientDB(_db):
@@ -162,3 +167,23 @@ def getAll():
     """
     return sorted(DATABASES.keys())
 
+
+def flushAll():
+    """
+    Write the cached changes of all dbs to disk. Dbs without a caching storage (see
+    tinydb.middlewares.CachingMiddleware) are skipped.
+    :return:
+    """
+    for db in list(DATABASES.values()):
+        flush = getattr(db._storage, 'flush', None)
+        if flush is None:
+            continue
+
+        try:
+            flush()
+        except Exception as error:
+            print 'Could not flush %s: %s' % (db.name(), error)
+
+
+# make sure cached changes reach the disk when the session ends
+atexit.register(flushAll)
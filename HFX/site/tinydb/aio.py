@@ -0,0 +1,370 @@
+"""
+Contains an asyncio facade for :class:`~tinydb.database.TinyDB`.
+
+The operations run in a bounded thread pool, so a coroutine waiting for a
+search doesn't block the event loop:
+
+>>> adb = AsyncTinyDB(TinyDB('assets.db', thread_safe=True))
+>>> shots = yield from adb.table('Shots').asearch(where('type') == 'shot')
+>>> eid = yield from adb.table('Shots').ainsert({'type': 'shot'})
+>>> it = adb.table('Shots').aiter_search(where('status') == 'wip')
+
+``await`` works the same and the iterators support ``async for``. Writes
+queued while another group of writes is committed are committed together in
+a single transaction (see :meth:`TinyDB.transaction
+<tinydb.database.TinyDB.transaction>`).
+
+Reads run in parallel if the database is thread-safe, otherwise they wait
+for each other and for the writes. Requires Python 3.
+"""
+
+from collections import deque
+import functools
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2
+    asyncio = None
+
+__all__ = ('AsyncTinyDB', 'AsyncTable')
+
+
+def _transfer(source, target, func=None):
+    """
+    Resolve ``target`` with the result of ``source`` (passed through
+    ``func``) or its exception.
+    """
+
+    if target.cancelled():
+        return
+
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    elif func is None:
+        target.set_result(source.result())
+    else:
+        try:
+            result = func(source.result())
+        except BaseException as error:
+            target.set_exception(error)
+        else:
+            target.set_result(result)
+
+
+class AsyncTinyDB(object):
+    """
+    Gives coroutines access to a database.
+
+    Unknown attributes are forwarded to the default table like
+    :class:`~tinydb.database.TinyDB` does.
+    """
+
+    #: How many operations run at the same time
+    MAX_WORKERS = 4
+
+    def __init__(self, db, max_workers=None, loop=None):
+        """
+        :param db: The database to access.
+        :type db: TinyDB
+        :param max_workers: How many operations run at the same time
+                            (default: :attr:`MAX_WORKERS`).
+        :param loop: The event loop to use, by default the one running.
+        """
+
+        if asyncio is None:
+            raise RuntimeError('asyncio is not available')
+
+        self.db = db
+
+        self._executor = ThreadPoolExecutor(max_workers or self.MAX_WORKERS)
+        self._loop = loop
+
+        # The writes waiting for the next commit
+        self._pending = []
+        self._committing = False
+
+        self._tables = {}
+        self._table = self.table(db.DEFAULT_TABLE)
+
+    def _get_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    def table(self, name):
+        """
+        Get access to a table.
+
+        :param name: The name of the table.
+        :rtype: AsyncTable
+        """
+
+        if name not in self._tables:
+            self._tables[name] = AsyncTable(self, self.db.table(name))
+
+        return self._tables[name]
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['_table'], name)
+
+    def read(self, func, *args):
+        """
+        Run a read in the thread pool.
+
+        :returns: an awaitable for the result
+        """
+
+        return self._get_loop().run_in_executor(
+            self._executor, functools.partial(self._locked, func, *args)
+        )
+
+    def _locked(self, func, *args):
+        if self.db._thread_safe:
+            return func(*args)
+
+        # Readers would see the changes of running writes
+        with self.db._lock:
+            return func(*args)
+
+    def write(self, func, *args):
+        """
+        Queue a write for the next commit.
+
+        :returns: an awaitable for the result
+        """
+
+        loop = self._get_loop()
+        future = loop.create_future()
+        self._pending.append((functools.partial(func, *args), future))
+
+        if not self._committing:
+            self._committing = True
+            # Let the other coroutines queue their writes first
+            loop.call_soon(self._commit_pending)
+
+        return future
+
+    def _commit_pending(self):
+        batch, self._pending = self._pending, []
+
+        done = self._get_loop().run_in_executor(self._executor, self._commit,
+                                                [func for func, _ in batch])
+        done.add_done_callback(functools.partial(self._committed, batch))
+
+    def _commit(self, funcs):
+        """
+        Run the writes of a batch in a single transaction.
+
+        If the transaction fails, the writes are run one by one, so only the
+        failing ones fail.
+
+        :returns: a list of the writes' results and exceptions
+        """
+
+        if len(funcs) > 1:
+            try:
+                with self.db.transaction():
+                    return [(func(), None) for func in funcs]
+            except Exception:
+                pass
+
+        outcomes = []
+        for func in funcs:
+            try:
+                outcomes.append((func(), None))
+            except Exception as error:
+                outcomes.append((None, error))
+
+        return outcomes
+
+    def _committed(self, batch, done):
+        if done.cancelled() or done.exception() is not None:
+            outcomes = [(None, done.exception() or
+                         asyncio.CancelledError())] * len(batch)
+        else:
+            outcomes = done.result()
+
+        for (_, future), (result, error) in zip(batch, outcomes):
+            if future.cancelled():
+                continue
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+        if self._pending:
+            self._commit_pending()
+        else:
+            self._committing = False
+
+    def aclose(self):
+        """
+        Commit the queued writes and close the database.
+
+        :returns: an awaitable
+        """
+
+        loop = self._get_loop()
+        closed = loop.create_future()
+
+        def close(_):
+            done = loop.run_in_executor(self._executor, self.db.close)
+            done.add_done_callback(
+                functools.partial(_transfer, target=closed)
+            )
+            done.add_done_callback(
+                lambda _: self._executor.shutdown(wait=False)
+            )
+
+        # Writes are committed in order, so all others are done before this
+        self.write(lambda: None).add_done_callback(close)
+
+        return closed
+
+
+class AsyncTable(object):
+    """
+    Gives coroutines access to a table, see :class:`AsyncTinyDB`.
+
+    The methods take the same arguments as the ones of
+    :class:`~tinydb.database.Table` without the ``a`` and return awaitables.
+    """
+
+    #: How many elements the iterators fetch at once
+    CHUNK_SIZE = 100
+
+    def __init__(self, adb, table):
+        self._adb = adb
+
+        #: The :class:`~tinydb.database.Table`
+        self.table = table
+
+    def asearch(self, cond):
+        return self._adb.read(self.table.search, cond)
+
+    def aget(self, cond=None, eid=None):
+        return self._adb.read(self.table.get, cond, eid)
+
+    def aget_many(self, eids):
+        return self._adb.read(self.table.get_many, eids)
+
+    def aall(self):
+        return self._adb.read(self.table.all)
+
+    def acount(self, cond):
+        return self._adb.read(self.table.count, cond)
+
+    def acontains(self, cond=None, eids=None):
+        return self._adb.read(self.table.contains, cond, eids)
+
+    def alen(self):
+        return self._adb.read(len, self.table)
+
+    def ainsert(self, element):
+        return self._adb.write(self.table.insert, element)
+
+    def ainsert_multiple(self, elements):
+        # The elements may be a generator the coroutine keeps using
+        return self._adb.write(self.table.insert_multiple, list(elements))
+
+    def aupdate(self, fields, cond=None, eids=None):
+        return self._adb.write(self.table.update, fields, cond, eids)
+
+    def aremove(self, cond=None, eids=None):
+        return self._adb.write(self.table.remove, cond, eids)
+
+    def apurge(self):
+        return self._adb.write(self.table.purge)
+
+    def aiter_search(self, cond=None, chunk_size=None):
+        """
+        Iterate over the (matching) elements with ``async for``.
+
+        The elements are fetched in chunks of ``chunk_size`` (default:
+        :attr:`CHUNK_SIZE`) from the same snapshot if the database is
+        thread-safe, otherwise all at once.
+
+        >>> it = adb.table('Shots').aiter_search(where('status') == 'wip')
+        >>> async for shot in it:
+        ...     print(shot['name'])
+
+        :param cond: only yield elements matching this condition
+        :type cond: Query
+        """
+
+        if cond is None:
+            # All elements of the snapshot the iterator starts with
+            elements = lambda: iter(self.table.all())
+        else:
+            elements = functools.partial(self.table.iter_search, cond)
+
+        if not self._adb.db._thread_safe:
+            chunk_size = None
+        elif chunk_size is None:
+            chunk_size = self.CHUNK_SIZE
+
+        return _AsyncIterator(self._adb, elements, chunk_size)
+
+    def __aiter__(self):
+        return self.aiter_search()
+
+
+class _AsyncIterator(object):
+    """
+    Fetches the elements of an iterator in the thread pool.
+    """
+
+    def __init__(self, adb, elements, chunk_size):
+        self._adb = adb
+        self._start = elements
+        self._elements = None
+        self._chunk_size = chunk_size
+
+        self._buffer = deque()
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    def _fetch(self):
+        if self._elements is None:
+            self._elements = self._start()
+
+        chunk = []
+        for element in self._elements:
+            chunk.append(element)
+            if len(chunk) == self._chunk_size:
+                break
+        else:
+            self._exhausted = True
+
+        return chunk
+
+    def _next(self, chunk=None):
+        if chunk:
+            self._buffer.extend(chunk)
+
+        if not self._buffer:
+            raise StopAsyncIteration
+
+        return self._buffer.popleft()
+
+    def __anext__(self):
+        loop = self._adb._get_loop()
+        future = loop.create_future()
+
+        if self._buffer or self._exhausted:
+            try:
+                future.set_result(self._next())
+            except StopAsyncIteration as error:
+                future.set_exception(error)
+            return future
+
+        fetched = self._adb.read(self._fetch)
+        fetched.add_done_callback(
+            functools.partial(_transfer, target=future, func=self._next)
+        )
+
+        return future
@@ -0,0 +1,37 @@
+"""
+Benchmarks of the table operations, run them from the ``site`` directory
+with Python 2 or 3::
+
+    python -m tinydb.benchmarks.queries [rows]
+
+They print their timings and don't change any existing file.
+"""
+
+from __future__ import print_function
+
+import time
+
+
+def timed(func, *args):
+    """
+    Run a function once.
+
+    :returns: the function's result and the seconds it took
+    :rtype: tuple
+    """
+
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def report(label, seconds, rows=None):
+    """
+    Print a timing, per row too if the number of rows is given.
+    """
+
+    if rows:
+        print('{0:<40} {1:8.3f}s {2:10.0f} ns/row'.format(
+            label, seconds, seconds * 1e9 / rows))
+    else:
+        print('{0:<40} {1:8.3f}s'.format(label, seconds))
@@ -0,0 +1,129 @@
+"""
+Memory held by :class:`~tinydb.database.Element` and
+:class:`~tinydb.database.CompactElement` rows with the same fields, see
+:meth:`TinyDB.table <tinydb.database.TinyDB.table>`::
+
+    python -m tinydb.benchmarks.elements [rows]
+
+Needs :mod:`tracemalloc` (Python 3). The rows are created from the same
+decoded values, so only the rows themselves are counted. Then a table is
+loaded from a JSON file written to a temporary directory, with and without
+``compact=True``.
+"""
+
+from __future__ import print_function
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from tinydb.benchmarks import report, timed
+from tinydb.database import Element, Schemas, TinyDB
+from tinydb.queries import where
+from tinydb.storages import JSONStorage
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+#: Default number of rows
+ROWS = 200000
+
+
+def make_rows(count):
+    """
+    Render log rows with 8 fields, decoded from JSON like the stored ones.
+
+    :rtype: list[dict]
+    """
+
+    return json.loads(json.dumps([
+        {'frame': i, 'shot': 'sh{0:03d}'.format(i % 300),
+         'user': 'artist{0}'.format(i % 20), 'status': 'done',
+         'seconds': i * 0.5, 'memory': i % 4096,
+         'host': 'node{0:02d}'.format(i % 40), 'app': 'nuke'}
+        for i in range(count)]))
+
+
+def traced(func, *args):
+    """
+    Run a function and measure the memory it allocated and still holds.
+
+    :returns: the function's result and the bytes held
+    :rtype: tuple
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def make_elements(rows):
+    return [Element(value, eid) for eid, value in enumerate(rows, 1)]
+
+
+def make_compact(rows):
+    schemas = Schemas()
+    return [schemas.element(value, eid) for eid, value in enumerate(rows, 1)]
+
+
+def load(path, compact):
+    db = TinyDB(path, storage=JSONStorage)
+    table = db.table('log', compact=compact)
+    table.all()
+    return db, table
+
+
+def report_memory(label, size, count):
+    print('{0:<40} {1:8.1f} MB {2:7.0f} bytes/row'.format(
+        label, size / 1e6, size / float(count)))
+
+
+def main(count=ROWS):
+    if tracemalloc is None:
+        print('The memory benchmark needs tracemalloc (Python 3)')
+        return
+
+    rows = make_rows(count)
+    print('{0} rows with 8 fields, Python {1}'.format(
+        count, sys.version.split()[0]))
+
+    for label, func in (('Element', make_elements),
+                        ('CompactElement', make_compact)):
+        elements, size = traced(func, rows)
+        report_memory(label, size, count)
+        del elements
+
+    location = tempfile.mkdtemp()
+    path = os.path.join(location, 'log.json')
+
+    try:
+        with open(path, 'w') as handle:
+            json.dump({'log': dict((str(eid), value)
+                                   for eid, value in enumerate(rows, 1))},
+                      handle)
+        del rows
+
+        for compact in (False, True):
+            label = 'compact table' if compact else 'table'
+            (db, table), size = traced(load, path, compact)
+            report_memory(label + ' loaded', size, count)
+            report(label + ' scan',
+                   timed(table.count, where('memory') > 4000)[1], count)
+            db.close()
+            del db, table
+    finally:
+        shutil.rmtree(location)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,66 @@
+"""
+Per row cost of a query run as nested closures and as a compiled function,
+see :mod:`tinydb.compiler`::
+
+    python -m tinydb.benchmarks.queries [rows]
+"""
+
+from __future__ import print_function
+
+import random
+import sys
+
+from tinydb.benchmarks import report, timed
+from tinydb.compiler import compile_query
+from tinydb.queries import where
+
+#: Default number of rows
+ROWS = 1000000
+
+
+def make_rows(count):
+    """
+    Render log like rows with a nested field.
+
+    :rtype: list[dict]
+    """
+
+    rand = random.Random(1)
+    return [{'type': rand.choice(('a', 'b', 'c')),
+             'v': rand.random(),
+             'frame': 900 + i % 240,
+             'p': {'o': i % 3}} for i in range(count)]
+
+
+def make_query():
+    """
+    A query mixing ``&``, ``|``, ``~``, comparisons and a nested path.
+    """
+
+    return (((where('type') == 'a') | (where('type') == 'b')) &
+            (where('v') < 0.3) &
+            (where('frame') >= 1000) &
+            ~(where('p').o == 2))
+
+
+def count(test, rows):
+    return sum(1 for row in rows if test(row))
+
+
+def main(count_rows=ROWS):
+    rows = make_rows(count_rows)
+    query = make_query()
+    test = compile_query(query)
+
+    closures, closures_time = timed(count, query, rows)
+    compiled, compiled_time = timed(count, test, rows)
+    assert closures == compiled, (closures, compiled)
+
+    print('{0} rows, {1} matching, Python {2}'.format(
+        count_rows, compiled, sys.version.split()[0]))
+    report('closures', closures_time, count_rows)
+    report('compiled', compiled_time, count_rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,88 @@
+"""
+Open, point lookup and scan times of a numeric render stats table stored by
+:class:`~tinydb.storages.JSONStorage` and by
+:class:`~tinydb.storages.BinaryStorage`::
+
+    python -m tinydb.benchmarks.storages [rows]
+
+The JSON file is written to a temporary directory and converted with
+:func:`~tinydb.storages.convert`.
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from tinydb.benchmarks import report, timed
+from tinydb.database import TinyDB
+from tinydb.queries import where
+from tinydb.storages import BinaryStorage, JSONStorage, convert
+
+#: Default number of rows
+ROWS = 300000
+
+#: How many elements are looked up by their ID
+LOOKUPS = 1000
+
+
+def make_json(path, count):
+    rand = random.Random(1)
+    db = TinyDB(path, storage=JSONStorage)
+    db.table('stats').insert_multiple(
+        {'frame': 1001 + i % 240, 'time': rand.random() * 100,
+         'mem': rand.randint(1, 64000), 'cpu': rand.random(),
+         'host': 'node{0:03d}'.format(i % 200)} for i in range(count))
+    db.close()
+
+
+def open_table(path, storage):
+    db = TinyDB(path, storage=storage)
+    return db, db.table('stats')
+
+
+def lookup(table, eids):
+    for eid in eids:
+        table.get(eid=eid)
+
+
+def main(count=ROWS):
+    location = tempfile.mkdtemp()
+    json_path = os.path.join(location, 'stats.json')
+    binary_path = os.path.join(location, 'stats.tdb')
+
+    try:
+        make_json(json_path, count)
+        _, seconds = timed(convert, JSONStorage(json_path),
+                           BinaryStorage(binary_path))
+
+        print('{0} rows, JSON {1:.1f} MB, binary {2:.1f} MB, Python {3}'
+              .format(count, os.path.getsize(json_path) / 1e6,
+                      os.path.getsize(binary_path) / 1e6,
+                      sys.version.split()[0]))
+        report('convert', seconds)
+
+        rand = random.Random(2)
+        eids = [rand.randint(1, count) for _ in range(LOOKUPS)]
+
+        for storage, path in ((JSONStorage, json_path),
+                              (BinaryStorage, binary_path)):
+            name = storage.__name__
+            (db, table), seconds = timed(open_table, path, storage)
+            report(name + ' open', seconds)
+            report('{0} {1} point lookups'.format(name, LOOKUPS),
+                   timed(lookup, table, eids)[1])
+            report(name + ' first scan',
+                   timed(table.count, where('time') > 50)[1], count)
+            report(name + ' second scan',
+                   timed(table.count, where('time') > 60)[1], count)
+            db.close()
+    finally:
+        shutil.rmtree(location)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
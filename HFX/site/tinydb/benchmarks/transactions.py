@@ -0,0 +1,87 @@
+"""
+Bulk import into a :class:`~hfx_py.data.StaticDB`, one commit per insert and
+in a single transaction (see :meth:`TinyDB.transaction
+<tinydb.database.TinyDB.transaction>`). HFX's modules need Python 2::
+
+    python -m tinydb.benchmarks.transactions [rows]
+
+The databases are written to a temporary directory.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+
+import tinydb
+from tinydb.benchmarks import report, timed
+from tinydb.storages import JournalStorage, JSONStorage
+
+# hfx_py is next to the site directory
+_HFX = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(tinydb.__file__))))
+if _HFX not in sys.path:
+    sys.path.insert(0, _HFX)
+
+from hfx_py.data import StaticDB
+
+#: Default number of rows to import
+ROWS = 5000
+
+#: Rows of the other table, every commit writes them too
+APPLICATIONS = 2000
+
+
+def make_db(location, name, storage):
+    """
+    A database holding the applications table.
+    """
+
+    db = StaticDB(name, location, storage=storage)
+    db.table('Applications').insert_multiple(
+        {'name': 'app{0}'.format(i), 'version': '1.{0}'.format(i % 10),
+         'path': '/opt/apps/app{0}/bin'.format(i)}
+        for i in range(APPLICATIONS))
+    return db
+
+
+def make_vars(count):
+    return [{'name': 'VAR_{0}'.format(i), 'value': '/mnt/show/{0}'.format(i),
+             'scope': ('show', 'seq', 'shot')[i % 3]} for i in range(count)]
+
+
+def import_plain(db, rows):
+    table = db.table('Vars')
+    for row in rows:
+        table.insert(row)
+
+
+def import_transaction(db, rows):
+    with db.transaction():
+        import_plain(db, rows)
+
+
+def main(count=ROWS):
+    location = tempfile.mkdtemp()
+    rows = make_vars(count)
+
+    print('{0} inserts, {1} other rows, Python {2}'.format(
+        count, APPLICATIONS, sys.version.split()[0]))
+
+    try:
+        for storage in (JSONStorage, JournalStorage):
+            for label, func in (('plain', import_plain),
+                                ('transaction', import_transaction)):
+                db = make_db(location, storage.__name__ + label, storage)
+                _, seconds = timed(func, db, rows)
+                assert len(db.table('Vars')) == count
+                db.close()
+                report('{0} {1}'.format(storage.__name__, label), seconds)
+    finally:
+        shutil.rmtree(location)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
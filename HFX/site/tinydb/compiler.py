@@ -0,0 +1,219 @@
+"""
+Compiles queries into plain functions.
+
+Every combination of queries wraps the combined queries in another lambda and
+every test walks its path in a nested function. Running a query with a few
+``&`` and ``|`` therefore costs a handful of Python calls per element.
+:func:`compile_query` generates the source of a single function testing the
+whole query and compiles it:
+
+>>> test = compile_query((where('type') == 'shot') & (where('frame') > 1001))
+>>> test({'type': 'shot', 'frame': 1010})
+True
+
+The generated function for the query above looks like this::
+
+    def test(element):
+        r = True
+        if r:
+            try:
+                v = element['type']
+            except (KeyError, TypeError):
+                r = False
+            else:
+                r = v == 'shot'
+        if r:
+            try:
+                v = element['frame']
+            except (KeyError, TypeError):
+                r = False
+            else:
+                r = v > 1001
+        return r
+
+Compiled functions are cached by the query's hash value.
+"""
+
+import sys
+import threading
+
+from tinydb.utils import LRUCache, compile_regex
+
+__all__ = ('compile_query',)
+
+try:
+    _TEXT_TYPES = (str, unicode)
+except NameError:  # Python 3
+    _TEXT_TYPES = (str,)
+
+try:
+    _LITERAL_TYPES = _TEXT_TYPES + (int, long, bool, type(None))
+except NameError:  # Python 3
+    _LITERAL_TYPES = _TEXT_TYPES + (int, bool, type(None))
+
+#: Queries nested deeper than this aren't compiled
+MAX_DEPTH = 40
+
+#: How many compiled queries to cache
+CACHE_SIZE = 256
+
+_cache = LRUCache(capacity=CACHE_SIZE)
+_cache_lock = threading.Lock()
+
+# The tests that can be written as an expression of the value ``v`` and the
+# query's right hand side ``c``
+_EXPRESSIONS = {
+    '==': '{v} == {c}',
+    '!=': '{v} != {c}',
+    '<': '{v} < {c}',
+    '<=': '{v} <= {c}',
+    '>': '{v} > {c}',
+    '>=': '{v} >= {c}',
+    'exists': 'True',
+    'matches': '{c}.match({v})',
+    'search': '{c}.search({v})',
+}
+
+
+def compile_query(cond):
+    """
+    Compile a query into a single function.
+
+    Queries that can't be compiled (plain callables, very deep queries) are
+    returned unchanged.
+
+    :param cond: the query to compile
+    :type cond: QueryImpl
+    :returns: a function testing an element
+    """
+
+    hashval = getattr(cond, 'hashval', None)
+    if hashval is None:
+        return cond
+
+    with _cache_lock:
+        func = _cache.get(hashval)
+    if func is not None:
+        return func
+
+    compiler = _Compiler()
+    if compiler.depth(cond) > MAX_DEPTH:
+        func = cond
+    else:
+        func = compiler.compile(cond)
+
+    with _cache_lock:
+        _cache[hashval] = func
+    return func
+
+
+class _Compiler(object):
+    """
+    Generates the source of a compiled query.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {}
+
+    def depth(self, cond):
+        return 1 + max([self.depth(child) for child in cond.children] or [0])
+
+    def compile(self, cond):
+        self.lines.append('def test(element):')
+        self.emit(cond, 1)
+        self.lines.append('    return r')
+
+        source = '\n'.join(self.lines)
+        exec(compile(source, '<query {0!r}>'.format(cond), 'exec'),
+             self.namespace)
+
+        return self.namespace['test']
+
+    def constant(self, value):
+        """
+        Get the source of a constant, binding it to a name if it has no
+        literal.
+        """
+        if type(value) in _LITERAL_TYPES:
+            return repr(value)
+
+        name = 'c{0}'.format(len(self.namespace))
+        self.namespace[name] = value
+
+        return name
+
+    def write(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def emit(self, cond, indent):
+        """
+        Emit the code setting ``r`` to the result of ``cond``.
+        """
+        op = cond.hashval[0]
+
+        if op in ('and', 'or') and cond.children:
+            # Run every part as long as the result is undecided
+            self.write(indent, 'r = {0}'.format(op == 'and'))
+            check = 'if r:' if op == 'and' else 'if not r:'
+
+            for child in cond.children:
+                self.write(indent, check)
+                self.emit(child, indent + 1)
+
+        elif op == 'not' and cond.children:
+            self.emit(cond.children[0], indent)
+            self.write(indent, 'r = not r')
+
+        elif self.inlinable(cond):
+            self.emit_test(cond, indent)
+
+        else:
+            # Call the query's own test
+            self.write(indent, 'r = {0}(element)'.format(
+                self.constant(cond.test)))
+
+    @staticmethod
+    def inlinable(cond):
+        hashval = cond.hashval
+
+        if hashval[0] not in _EXPRESSIONS and hashval[0] != 'test':
+            return False
+
+        if hashval[0] in ('==', '!='):
+            rhs = hashval[2]
+
+            # Lists and dicts have been frozen for the hash value
+            if not isinstance(rhs, _LITERAL_TYPES + (float,)):
+                return False
+
+            # The query decodes byte strings to compare them to unicode
+            if (sys.version_info < (3, 0) and isinstance(rhs, _TEXT_TYPES)
+                    and any(ord(char) > 127 for char in rhs)):
+                return False
+
+        return True
+
+    def emit_test(self, cond, indent):
+        hashval = cond.hashval
+        op, path = hashval[0], hashval[1]
+
+        if op == 'test':
+            expression = '{0}(v, *{1})'.format(self.constant(hashval[2]),
+                                              self.constant(hashval[3]))
+        else:
+            rhs = hashval[2] if len(hashval) > 2 else None
+            if op in ('matches', 'search'):
+                rhs = compile_regex(rhs)
+
+            expression = _EXPRESSIONS[op].format(v='v', c=self.constant(rhs))
+
+        value = 'element' + ''.join('[{0}]'.format(self.constant(part))
+                                    for part in path)
+
+        self.write(indent, 'try:')
+        self.write(indent + 1, 'v = ' + value)
+        self.write(indent, 'except (KeyError, TypeError):')
+        self.write(indent + 1, 'r = False')
+        self.write(indent, 'else:')
+        self.write(indent + 1, 'r = ' + expression)
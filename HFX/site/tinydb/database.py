@@ -2,8 +2,21 @@
 Contains the :class:`database <tinydb.database.TinyDB>` and
 :class:`tables <tinydb.database.Table>` implementation.
 """
-from tinydb import JSONStorage
-from tinydb.utils import LRUCache, iteritems, itervalues
+from collections import namedtuple
+from contextlib import contextmanager
+import copy
+from itertools import islice
+import multiprocessing
+import sys
+import threading
+
+from tinydb import JSONStorage, parallel
+from tinydb.indexes import ColumnIndex, HashIndex, SortedIndex, sort_group
+from tinydb.compiler import compile_query
+from tinydb.planner import plan_query
+from tinydb.utils import (LRUCache, MISSING, Mapping, MutableMapping,
+                          StringPool, freeze, iteritems, itervalues,
+                          resolve_path)
 
 
 class Element(dict):
@@ -12,6 +25,9 @@ class Element(dict):
 
     This is a transparent proxy for database elements. It exists
     to provide a way to access an element's id via ``el.eid``.
+
+    Elements are shared with the table's read cache, so they should be
+    changed through :meth:`Table.update` only.
     """
     def __init__(self, value=None, eid=None, **kwargs):
         super(Element, self).__init__(**kwargs)
@@ -21,36 +37,473 @@ class Element(dict):
             self.eid = eid
 
 
+class Schema(object):
+    """
+    The keys of the :class:`CompactElement` objects having the same fields.
+    """
+
+    __slots__ = ('keys', 'positions')
+
+    def __init__(self, keys):
+        #: The keys in the order of the elements' values
+        self.keys = keys
+
+        #: Maps the keys to the positions of their values
+        self.positions = dict((key, pos) for pos, key in enumerate(keys))
+
+
+class Schemas(object):
+    """
+    The schemas of a compact table's elements, shared by all elements with
+    the same keys.
+    """
+
+    def __init__(self):
+        self._schemas = {}
+
+    def __len__(self):
+        return len(self._schemas)
+
+    def element(self, value, eid):
+        """
+        Create a :class:`CompactElement` from a dict.
+        """
+
+        keys = tuple(value)
+
+        schema = self._schemas.get(keys)
+        if schema is None:
+            schema = self._schemas[keys] = Schema(keys)
+
+        return CompactElement(schema, tuple(value[key] for key in keys), eid)
+
+
+class CompactElement(Mapping):
+    """
+    An element of a compact table (see :meth:`TinyDB.table`).
+
+    Stores only the values, the keys are shared with all elements having the
+    same fields (see :class:`Schema`). It's a read-only mapping, updating
+    an element replaces it with an :class:`Element` while it's changed.
+    """
+
+    __slots__ = ('_schema', '_values', 'eid')
+
+    def __init__(self, schema, values, eid):
+        self._schema = schema
+        self._values = values
+        self.eid = eid
+
+    def __getitem__(self, key):
+        return self._values[self._schema.positions[key]]
+
+    def __contains__(self, key):
+        return key in self._schema.positions
+
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        """
+        Get the element's fields as a new dict.
+        """
+        return dict(zip(self._schema.keys, self._values))
+
+    # ujson serializes objects through this method, it only takes the
+    # default hook of tinydb.storages._json_options since version 5.1
+    toDict = copy
+
+
+def _copy_element(element, eid):
+    """
+    Copy an element to change it without changing the original.
+
+    Compact elements are never changed, so they are shared.
+    """
+
+    if isinstance(element, CompactElement):
+        return element
+
+    return Element(element, eid)
+
+
+class LazyElements(MutableMapping):
+    """
+    The elements of a table, decoded from the storage on first access.
+
+    Used for storages returning a :class:`~tinydb.storages.LazyTable` from
+    :meth:`~tinydb.storages.Storage.read_table`. The decoded and changed
+    elements are kept, :attr:`records` is never changed.
+    """
+
+    def __init__(self, records, element=Element):
+        #: The storage's mapping of element IDs to values
+        self.records = records
+
+        #: Creates an element from a value and its ID
+        self.element = element
+
+        self._elements = {}
+        self._removed = set()
+        self._len = len(records)
+
+    def decoded(self, eid):
+        """
+        Check whether an element has been decoded (or set).
+        """
+        return eid in self._elements
+
+    def __getitem__(self, eid):
+        try:
+            return self._elements[eid]
+        except KeyError:
+            if eid in self._removed:
+                raise
+
+        element = self._elements[eid] = self.element(self.records[eid], eid)
+        return element
+
+    def __setitem__(self, eid, element):
+        if eid not in self:
+            self._len += 1
+
+        self._elements[eid] = element
+        self._removed.discard(eid)
+
+    def __delitem__(self, eid):
+        if eid not in self:
+            raise KeyError(eid)
+
+        self._elements.pop(eid, None)
+        self._removed.add(eid)
+        self._len -= 1
+
+    def __contains__(self, eid):
+        if eid in self._elements:
+            return True
+
+        return eid not in self._removed and eid in self.records
+
+    def __iter__(self):
+        for eid in self.records:
+            if eid not in self._removed:
+                yield eid
+
+        for eid in self._elements:
+            if eid not in self.records:
+                yield eid
+
+    def __len__(self):
+        return self._len
+
+    def copy(self, elements=True):
+        """
+        Copy the table without decoding the elements.
+
+        :param elements: also copy the decoded elements, otherwise the copy
+                         shares them with this table
+        """
+
+        copy = LazyElements(self.records, self.element)
+        if elements:
+            copy._elements = dict(
+                (eid, _copy_element(element, eid))
+                for eid, element in iteritems(self._elements)
+            )
+        else:
+            copy._elements = dict(self._elements)
+        copy._removed = set(self._removed)
+        copy._len = self._len
+
+        return copy
+
+
 class StorageProxy(object):
-    def __init__(self, storage, table_name):
+    """
+    Gives a table access to its part of the storage.
+
+    The decoded table is kept as a snapshot and reused by every read until
+    the table is written. Each write increments :attr:`generation`, a
+    snapshot is only valid for the generation it was created in. If
+    another process changes the storage, :meth:`stale` tells the table to
+    drop the snapshot.
+    """
+
+    def __init__(self, storage, table_name, transaction=None, mutex=None,
+                 thread_safe=False):
         self._storage = storage
         self._table_name = table_name
 
+        #: The :class:`Transaction` buffering the writes or ``None``
+        self.transaction = transaction
+
+        #: The lock serializing the writes of all threads
+        self.mutex = threading.RLock() if mutex is None else mutex
+
+        #: Whether readers in other threads must never see a change while
+        #: it's made (see :class:`TinyDB`)
+        self.thread_safe = thread_safe
+
+        #: Incremented on every change of the table
+        self.generation = 0
+
+        self._snapshot = None
+        self._snapshot_generation = None
+        self._snapshot_version = None
+        self._isolated = None
+
+        #: The :class:`Schemas` of a compact table or ``None``
+        self.schemas = None
+
+        #: Whether to intern the strings of the table when reading it
+        self.intern_strings = False
+
+        #: The :class:`~tinydb.utils.StringPool` used when the table was
+        #: read last
+        self.strings = None
+
     def read(self):
-        try:
-            raw_data = (self._storage.read() or {})[self._table_name]
-        except KeyError:
+        if self._snapshot_generation != self.generation:
+            # Taken first, so changes made while decoding are noticed later
+            self._snapshot_version = self._storage.version()
+            self._snapshot = self._decode()
+            self._snapshot_generation = self.generation
+
+        if self.transaction is not None and self._isolated is not self.transaction:
+            # Storages may share their objects with the snapshot (like
+            # MemoryStorage does), so the transaction has to work on a copy
+            # to be able to roll back
+            if isinstance(self._snapshot, LazyElements):
+                self._snapshot = self._snapshot.copy()
+            else:
+                self._snapshot = dict(
+                    (eid, _copy_element(element, eid))
+                    for eid, element in iteritems(self._snapshot)
+                )
+            self._isolated = self.transaction
+
+        return self._snapshot
+
+    def _target(self):
+        return self._storage if self.transaction is None else self.transaction
+
+    def stale(self):
+        """
+        Check whether another process has changed the storage since the
+        snapshot was read (see :meth:`Storage.version
+        <tinydb.storages.Storage.version>`).
+
+        Snapshots copied for a transaction are never stale.
+        """
+        if self._snapshot is None or \
+                self._snapshot_generation != self.generation:
+            return False
+
+        if self.transaction is not None and \
+                self._isolated is self.transaction:
+            return False
+
+        version = self._storage.version()
+        return version is not None and version != self._snapshot_version
+
+    def in_transaction(self):
+        """
+        Check whether the current thread runs the transaction.
+        """
+        return self.transaction is not None and \
+            self.transaction.thread is threading.current_thread()
+
+    @contextmanager
+    def lock(self):
+        """
+        Keep other threads and processes from changing the storage (see
+        :meth:`Storage.lock <tinydb.storages.Storage.lock>`).
+        """
+        with self.mutex, self._storage.lock():
+            yield
+
+    def _info(self):
+        """
+        Get the table's metadata from the storage if there's no snapshot.
+        """
+        if self._snapshot is not None and \
+                self._snapshot_generation == self.generation:
+            return None
+
+        return self._target().table_info(self._table_name)
+
+    def count(self):
+        """
+        Get the number of elements, using the storage's metadata instead of
+        reading the table if possible.
+        """
+        info = self._info()
+        return len(self.read()) if info is None else info['count']
+
+    def last_id(self):
+        """
+        Get the highest element ID, using the storage's metadata instead of
+        reading the table if possible.
+        """
+        info = self._info()
+        if info is not None:
+            return info['last_id']
+
+        data = self.read()
+        return max(data) if data else 0
+
+    def _decode(self):
+        raw_data = self._target().read_table(self._table_name)
+        if raw_data is None:
             return {}
 
+        if isinstance(raw_data, LazyElements):
+            # Buffered by a transaction
+            return raw_data.copy()
+
+        interning = self.intern_strings and self.transaction is None
+        if interning:
+            self.strings = pool = StringPool()
+
+        if not isinstance(raw_data, dict):
+            if not interning:
+                return LazyElements(raw_data, self.element)
+
+            # The elements are decoded one by one
+            return LazyElements(raw_data, lambda value, eid: self.element(
+                pool.intern(value), eid
+            ))
+
+        if interning:
+            # Changes the storage's rows in place, so its copy shrinks too
+            for val in itervalues(raw_data):
+                pool.intern(val)
+
         data = {}
         for key, val in iteritems(raw_data):
             eid = int(key)
-            data[eid] = Element(val, eid)
+            data[eid] = self.element(val, eid)
 
         return data
 
-    def write(self, values):
-        data = self._storage.read() or {}
-        data[self._table_name] = values
-        self._storage.write(data)
+    def element(self, value, eid):
+        """
+        Create an element of the table from a dict.
+        """
+        if self.schemas is None:
+            return Element(value, eid)
+
+        return self.schemas.element(value, eid)
+
+    def write(self, values, eids=None):
+        """
+        Write the table and keep ``values`` as the new snapshot.
+
+        :param values: the table's elements, keyed by their IDs
+        :type values: dict[int, Element]
+        :param eids: the IDs of the changed elements or ``None``
+        """
+        self.generation += 1
 
-    def purge_table(self):
         try:
-            data = self._storage.read() or {}
-            del data[self._table_name]
-            self._storage.write(data)
-        except KeyError:
-            pass
+            self._target().write_table(self._table_name, values, eids)
+        except Exception:
+            self._snapshot = None
+            raise
+
+        self._snapshot = values
+        self._snapshot_generation = self.generation
+        self._snapshot_version = self._storage.version()
+
+    def invalidate(self):
+        """
+        Drop the snapshot, e.g. after the storage has been changed directly.
+        """
+        self.generation += 1
+        self._snapshot = None
+
+    def purge_table(self):
+        self._target().purge_table(self._table_name)
+
+
+class Transaction(object):
+    """
+    Buffers the writes to all tables of a database until they are committed
+    together, see :meth:`TinyDB.transaction`.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+        # Maps table names to the table's state and the IDs of the changed
+        # elements or to None for removed tables
+        self._tables = {}
+
+        #: Set if an operation failed and left a table half-changed
+        self.failed = False
+
+        #: The thread running the transaction
+        self.thread = threading.current_thread()
+
+    def table_info(self, name):
+        if name not in self._tables:
+            return self._storage.table_info(name)
+
+        # Let the table count its buffered elements
+        return None
+
+    def read_table(self, name):
+        if name not in self._tables:
+            return self._storage.read_table(name)
+
+        entry = self._tables[name]
+        return None if entry is None else entry[0]
+
+    def write_table(self, name, values, eids=None):
+        if name in self._tables:
+            entry = self._tables[name]
+            if entry is None or entry[1] is None or eids is None:
+                changed = None
+            else:
+                changed = entry[1].union(eids)
+        else:
+            changed = None if eids is None else set(eids)
+
+        self._tables[name] = (values, changed)
+
+    def purge_table(self, name):
+        self._tables[name] = None
+
+    def tables(self, names):
+        """
+        Apply the buffered changes to a set of stored table names.
+        """
+        names = set(names)
+
+        for name, entry in iteritems(self._tables):
+            if entry is None:
+                names.discard(name)
+            else:
+                names.add(name)
+
+        return names
+
+    def changed(self):
+        """
+        Get the names of all changed tables.
+        """
+        return set(self._tables)
+
+    def commit(self):
+        if self._tables:
+            self._storage.write_tables(self._tables)
+            self._tables = {}
 
 
 class TinyDB(object):
@@ -59,6 +512,14 @@ class TinyDB(object):
 
     Gives access to the database, provides methods to insert/search/remove
     and getting tables.
+
+    The writes of all threads are serialized by a single lock. Reads wait
+    for running writes to finish unless ``thread_safe`` is set: Writers
+    then change copies of the elements and indexes and publish them when
+    they're done, readers use the last published ones without locking.
+    A long search in a worker thread never sees a half-applied update.
+
+    >>> db = TinyDB('settings.db', thread_safe=True)
     """
 
     DEFAULT_TABLE = '_default'
@@ -73,13 +534,19 @@ class TinyDB(object):
 
         :param storage: The class of the storage to use. Will be initialized
                         with ``args`` and ``kwargs``.
+        :param thread_safe: Let readers use published snapshots instead of
+                            waiting for writers (copies the elements and
+                            indexes on every write).
         """
 
         storage = kwargs.pop('storage', TinyDB.DEFAULT_STORAGE)
         table = kwargs.pop('default_table', TinyDB.DEFAULT_TABLE)
+        self._thread_safe = kwargs.pop('thread_safe', False)
 
         # Prepare the storage
         self._opened = False
+        self._transaction = None
+        self._lock = threading.RLock()
 
         #: :type: Storage
         self._storage = storage(*args, **kwargs)
@@ -101,17 +568,34 @@ class TinyDB(object):
         :param name: The name of the table.
         :type name: str
         :param cache_size: How many query results to cache.
+        :param cache_bytes: How many bytes the cached query results may use.
+        :param columns: The numeric fields to keep in NumPy arrays, see
+                        :class:`~tinydb.indexes.ColumnIndex`.
+        :param compact: Store the elements without a dict each, see
+                        :class:`CompactElement`.
+        :param intern_strings: Keep only one copy of equal strings, see
+                               :meth:`Table.interning_stats`.
         """
 
         if name in self._table_cache:
             return self._table_cache[name]
 
-        table = self.table_class(StorageProxy(self._storage, name), **options)
+        with self._lock:
+            if name in self._table_cache:
+                return self._table_cache[name]
+
+            proxy = StorageProxy(self._storage, name, self._transaction,
+                                 self._lock, self._thread_safe)
+            table = self.table_class(proxy, **options)
 
-        self._table_cache[name] = table
+            # Another process may create the table between checking and
+            # writing it
+            with proxy.lock():
+                table._sync()
+                if not proxy.count():
+                    table._write({})
 
-        if not table._read():
-            table._write({})
+            self._table_cache[name] = table
 
         return table
 
@@ -123,15 +607,29 @@ class TinyDB(object):
         :rtype: set[str]
         """
 
-        return set(self._storage.read())
+        with self._lock:
+            names = self._storage.table_names()
+
+            if self._transaction is not None:
+                names = self._transaction.tables(names)
+
+        return names
 
     def purge_tables(self):
         """
         Purge all tables from the database. **CANNOT BE REVERSED!**
         """
 
-        self._storage.write({})
-        self._table_cache.clear()
+        with self._lock:
+            if self._transaction is not None:
+                for name in self.tables():
+                    self._transaction.purge_table(name)
+            else:
+                self._storage.write({})
+
+            for table in itervalues(self._table_cache):
+                table._reload()
+            self._table_cache.clear()
 
     def purge_table(self, name):
         """
@@ -140,11 +638,94 @@ class TinyDB(object):
         :param name: The name of the table.
         :type name: str
         """
-        if name in self._table_cache:
-            del self._table_cache[name]
+        with self._lock:
+            proxy = StorageProxy(self._storage, name, self._transaction)
+            proxy.purge_table()
 
-        proxy = StorageProxy(self._storage, name)
-        proxy.purge_table()
+            if name in self._table_cache:
+                self._table_cache.pop(name)._reload()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group the writes to all tables into a single commit.
+
+        Inside the ``with`` block, inserts, updates and removes only change
+        the tables in memory (reading them sees the changes). Leaving the
+        block writes all changes at once, which the storage does atomically
+        (see :meth:`Storage.write_tables
+        <tinydb.storages.Storage.write_tables>`). If the block raises an
+        exception, all changes are dropped.
+
+        >>> with db.transaction():
+        ...     for path in paths:
+        ...         db.table('Paths').insert({'path': path})
+
+        Nested transactions are part of the outermost one. The transaction
+        holds the write lock and the storage's lock (see :meth:`Storage.lock
+        <tinydb.storages.Storage.lock>`), so other threads and processes
+        can't write until it's done.
+        """
+
+        with self._lock:
+            if self._transaction is not None:
+                yield self._transaction
+                return
+
+            # The commit overwrites the stored tables, other processes
+            # mustn't write in between
+            with self._storage.lock():
+                transaction = Transaction(self._storage)
+                self._set_transaction(transaction)
+
+                try:
+                    yield transaction
+                except BaseException:
+                    self._set_transaction(None)
+                    self._rollback(transaction)
+                    raise
+
+                self._set_transaction(None)
+
+                if transaction.failed:
+                    self._rollback(transaction)
+                    raise RuntimeError('An operation failed inside the '
+                                       'transaction, all of its changes have '
+                                       'been dropped')
+
+                changed = transaction.changed()
+
+                try:
+                    transaction.commit()
+                except Exception:
+                    self._rollback(transaction)
+                    raise
+
+                # Readers of other threads have used the state before the
+                # transaction so far
+                for name in changed:
+                    if name in self._table_cache:
+                        self._table_cache[name]._publish()
+
+    def _set_transaction(self, transaction):
+        self._transaction = transaction
+
+        for table in itervalues(self._table_cache):
+            table._storage.transaction = transaction
+
+            if transaction is not None:
+                # The transaction works on copies of the elements
+                table.clear_cache()
+
+    def _rollback(self, transaction):
+        """
+        Reload all tables changed in a transaction from the storage.
+        """
+        changed = transaction.changed()
+
+        for name, table in list(iteritems(self._table_cache)):
+            if name in changed:
+                table._reload()
 
     def close(self):
         """
@@ -181,30 +762,216 @@ class TinyDB(object):
         return len(self._table)
 
 
+#: The elements and indexes readers use, see :meth:`Table._view`
+_View = namedtuple('_View', 'data indexes generation')
+
+
 class Table(object):
     """
     Represents a single TinyDB Table.
     """
 
-    def __init__(self, storage, cache_size=10):
+    def __init__(self, storage, cache_size=10, cache_bytes=None, columns=(),
+                 compact=False, intern_strings=False):
         """
         Get access to a table.
 
         :param storage: Access to the storage
         :type storage: StorageProxyus
         :param cache_size: Maximum size of query cache.
+        :param cache_bytes: Maximum memory used by the query cache's result
+                            lists or ``None`` for no limit.
+        :param columns: The numeric fields to keep in NumPy arrays. Queries
+                        comparing them are run on the whole array at once,
+                        :meth:`aggregate` sums them up the same way.
+        :param compact: Store the elements as :class:`CompactElement`
+                        objects sharing their keys.
+        :param intern_strings: Keep only one copy of equal strings when
+                               reading the table, see
+                               :meth:`interning_stats`.
         """
 
         self._storage = storage
-        self._query_cache = LRUCache(capacity=cache_size)
+        if compact:
+            storage.schemas = Schemas()
+        storage.intern_strings = intern_strings
+
+        # Maps queries to their results, the IDs of the results and the paths
+        # the query reads (see _update_cache)
+        self._query_cache = LRUCache(capacity=cache_size,
+                                     max_bytes=cache_bytes,
+                                     sizeof=_cache_entry_size)
+
+        self._cache_lock = threading.Lock()
+
+        self._indexes = {}
+        self._index_generation = None
+
+        # The view readers of other threads use in thread-safe mode
+        self._published = None
+
+        self._last_id = storage.last_id()
+
+        for field in columns:
+            self.create_index(field, ColumnIndex)
+
+    def _reload(self):
+        """
+        Drop everything derived from the table's data and read it again.
+
+        The lock has to be held.
+        """
+
+        self._storage.invalidate()
+        self.clear_cache()
+        self._published = None
+
+        self._last_id = self._storage.last_id()
+
+    def _sync(self):
+        """
+        Reload the table if another process has changed the storage.
+        """
+
+        if self._storage.stale():
+            with self._storage.mutex:
+                if self._storage.stale():
+                    self._reload()
+
+    def _ready_view(self):
+        """
+        Get the view published for readers of other threads or ``None`` if
+        the current thread has to wait for the lock to get one.
+        """
+
+        view = self._published
+        if view is None or self._storage.in_transaction():
+            return None
+
+        return view
+
+    def _view(self):
+        """
+        Get the elements and indexes to read.
+
+        In thread-safe mode these are the ones published by the last write
+        (see :meth:`_publish`). They are never changed afterwards, so reading
+        them doesn't need the lock.
+
+        :rtype: _View
+        """
+
+        self._sync()
+
+        view = self._ready_view()
+        if view is not None:
+            return view
+
+        with self._storage.mutex:
+            view = self._current_view()
+            if self._publishes():
+                self._published = view
+
+        return view
+
+    def _current_view(self):
+        """
+        Get the current elements and indexes, the lock has to be held.
+        """
+
+        data = self._storage.read()
+        self._sync_indexes()
+
+        return _View(data, dict(self._indexes), self._storage.generation)
+
+    def _publishes(self):
+        """
+        Check whether readers of other threads use published views.
+
+        The changes of a transaction are published when it is committed.
+        """
+
+        return self._storage.thread_safe and self._storage.transaction is None
+
+    def _publish(self):
+        """
+        Publish the current elements and indexes for the readers of other
+        threads. Writers don't change the published ones afterwards, see
+        :meth:`_editable`.
+
+        The lock has to be held.
+        """
+
+        if self._publishes():
+            self._published = self._current_view()
+
+    def _editable(self):
+        """
+        Get the elements and indexes to change.
+
+        The published ones are copied first (the elements themselves are
+        copied by :meth:`_changing`). The lock has to be held.
+
+        :returns: the elements and a list of the indexes
+        """
 
         data = self._read()
-        if data:
-            self._last_id = max(i for i in data)
-        else:
-            self._last_id = 0
+        self._sync_indexes()
+
+        view = self._published
+        if view is not None:
+            if data is view.data:
+                if isinstance(data, LazyElements):
+                    data = data.copy(elements=False)
+                else:
+                    data = dict(data)
+
+            for key, index in list(iteritems(self._indexes)):
+                if view.indexes.get(key) is index:
+                    self._indexes[key] = index.copy()
+
+        return data, list(itervalues(self._indexes))
+
+    def _changing(self, data, eid, nested=False):
+        """
+        Get an element to change in place.
+
+        In thread-safe mode readers may still use the element, so it's
+        replaced by a copy first. Set ``nested`` to copy the nested values
+        too. The read-only elements of compact tables are replaced by an
+        :class:`Element`, see :meth:`_changed`.
+        """
+
+        element = data[eid]
+
+        if self._storage.thread_safe or isinstance(element, CompactElement):
+            element = Element(element, eid)
+            if nested and self._storage.thread_safe:
+                element = copy.deepcopy(element)
+            data[eid] = element
+
+        return element
 
-    def process_elements(self, func, cond=None, eids=None):
+    def _changed(self, data, eid):
+        """
+        Store an element changed by :meth:`_changing` compactly again.
+        """
+
+        if self._storage.schemas is not None and eid in data:
+            data[eid] = self._storage.element(data[eid], eid)
+
+    def _caching(self):
+        """
+        Check whether the query cache can be used.
+
+        The cache is shared by all threads, so it's not used while the
+        transaction of a thread-safe table runs.
+        """
+
+        return not (self._storage.thread_safe and
+                    self._storage.transaction is not None)
+
+    def process_elements(self, func, cond=None, eids=None, fields=None):
         """
         Helper function for processing all elements specified by condition
         or IDs.
@@ -223,37 +990,215 @@ class Table(object):
                      second argument: the current eid
         :param cond: elements to use, or
         :param eids: elements to use
+        :param fields: the names of the fields ``func`` changes or ``None``
+                       if unknown. Cached queries not reading any of them
+                       are kept as they are.
         :returns: the element IDs that were affected during processed
         """
 
-        data = self._read()
+        with self._storage.lock():
+            data, indexes = self._editable()
+
+            def process(eid):
+                for index in indexes:
+                    index.remove(eid)
 
-        if eids is not None:
-            # Processed element specified by id
-            for eid in eids:
                 func(data, eid)
 
-        else:
-            # Collect affected eids
-            eids = []
+                if indexes and eid in data:
+                    for index in indexes:
+                        index.add(eid, data[eid])
 
-            # Processed elements specified by condition
-            for eid in list(data):
-                if cond(data[eid]):
-                    func(data, eid)
-                    eids.append(eid)
+            try:
+                if eids is not None:
+                    # Processed element specified by id
+                    for eid in eids:
+                        process(eid)
 
-        self._write(data)
+                else:
+                    # Collect affected eids
+                    eids = []
+
+                    # Processed elements specified by condition
+                    for eid in self._matching(cond, data, self._indexes):
+                        process(eid)
+                        eids.append(eid)
+
+                self._write(data, eids, fields)
+            except Exception:
+                self._discard_changes()
+                raise
 
         return eids
 
+    def _discard_changes(self):
+        """
+        Drop the snapshot and the indexes a failed write has changed
+        partially, they're read and built again next time.
+
+        The lock has to be held.
+        """
+
+        if self._storage.transaction is not None:
+            self._storage.transaction.failed = True
+        self._reload()
+
     def clear_cache(self):
         """
         Clear the query cache.
 
         A simple helper that clears the internal query cache.
         """
-        self._query_cache.clear()
+        with self._cache_lock:
+            self._query_cache.clear()
+
+    def cache_stats(self):
+        """
+        Get the statistics of the query cache.
+
+        >>> table.cache_stats()
+        {'hits': 120, 'misses': 8, 'evictions': 2, 'hit_rate': 0.9375,
+         'items': 6, 'bytes': 4512, 'capacity': 10, 'max_bytes': None}
+
+        :rtype: dict
+        """
+        with self._cache_lock:
+            return self._query_cache.stats()
+
+    def interning_stats(self):
+        """
+        Get what interning the strings saved when the table was read last
+        (see the ``intern_strings`` option of :meth:`TinyDB.table`).
+
+        >>> table.interning_stats()
+        {'strings': 1520, 'bytes': 2483208}
+
+        Tables the storage decodes lazily (like the ones of a
+        :class:`~tinydb.storages.BinaryStorage`) intern the strings of the
+        elements used so far.
+
+        :returns: the number of distinct strings and the bytes used by the
+                  copies that have been dropped or ``None`` if the strings
+                  aren't interned
+        :rtype: dict | None
+        """
+
+        if not self._storage.intern_strings:
+            return None
+
+        self._view()
+        pool = self._storage.strings or StringPool()
+
+        return {'strings': len(pool), 'bytes': pool.saved}
+
+    def create_index(self, field, index_cls=HashIndex):
+        """
+        Create an index on a field.
+
+        The index is kept up to date on every write. Searching the table
+        with a query the index can answer (equality tests for a
+        :class:`~tinydb.indexes.HashIndex`, also range tests for a
+        :class:`~tinydb.indexes.SortedIndex`, regular expressions for a
+        :class:`~tinydb.indexes.TextIndex`) will then look up the matching
+        elements in the index instead of testing every element.
+
+        >>> table.create_index('type')
+        >>> table.create_index(['info', 'owner'])  # Nested field
+        >>> table.create_index('frame', SortedIndex)
+        >>> table.create_index('comment', TextIndex)
+
+        :param field: the field's name or a list of keys for nested fields
+        :param index_cls: the class of the index to create
+        """
+
+        key = (self._index_path(field), index_cls)
+
+        with self._storage.mutex:
+            if key not in self._indexes:
+                index = index_cls(key[0])
+                index.build(self._read())
+                self._indexes[key] = index
+                self._publish()
+
+    def drop_index(self, field, index_cls=None):
+        """
+        Remove the indexes on a field.
+
+        :param field: the field's name or a list of keys for nested fields
+        :param index_cls: only remove the index of this class
+        """
+
+        path = self._index_path(field)
+
+        with self._storage.mutex:
+            for key in list(self._indexes):
+                if key[0] == path and index_cls in (None, key[1]):
+                    del self._indexes[key]
+            self._publish()
+
+    @staticmethod
+    def _index_path(field):
+        if isinstance(field, (list, tuple)):
+            return tuple(field)
+        return field,
+
+    def _sync_indexes(self):
+        """
+        Make sure the indexes match the current table contents.
+
+        Rebuilds the indexes if the table has been changed without them
+        (e.g. after the read cache has been invalidated).
+
+        :returns: a list of all indexes
+        """
+
+        if self._index_generation != self._storage.generation:
+            data = self._storage.read()
+            for key, index in list(iteritems(self._indexes)):
+                if self._storage.thread_safe:
+                    # Published views may still use the old index
+                    index = self._indexes[key] = index.copy()
+                index.build(data)
+            self._index_generation = self._storage.generation
+
+        return list(itervalues(self._indexes))
+
+    def _plan(self, cond, data, indexes):
+        """
+        Plan how to find the elements in ``data`` matching a query.
+
+        :param indexes: the indexes of ``data``
+        :type indexes: dict
+        :rtype: tinydb.planner.QueryPlan
+        """
+
+        return plan_query(cond, list(itervalues(indexes)), len(data))
+
+    def _matching(self, cond, data, indexes):
+        """
+        Iterate over the IDs of all elements in ``data`` matching a query.
+        """
+
+        return self._plan(cond, data, indexes).matching(data)
+
+    def explain(self, cond):
+        """
+        Describe how a query would be run.
+
+        Lists the index lookups used to find the candidates together with the
+        estimated number of candidates and whether the candidates still have
+        to be tested.
+
+        >>> print(table.explain(where('type') == 'application'))
+        IndexLookup HashIndex('type',) == 'application' (~40 of 500 rows)
+
+        :param cond: the condition to explain
+        :type cond: Query
+        :rtype: str
+        """
+
+        view = self._view()
+        return str(self._plan(cond, view.data, view.indexes))
 
     def _get_next_id(self):
         """
@@ -273,24 +1218,110 @@ class Table(object):
         :rtype: dict
         """
 
+        self._sync()
         return self._storage.read()
 
-    def _write(self, values):
+    def _write(self, values, eids=None, fields=None):
         """
         Writing access to the DB.
 
         :param values: the new values to write
         :type values: dict
+        :param eids: the IDs of the changed elements or ``None`` if all
+                     elements may have changed
+        :type eids: list
+        :param fields: the names of the changed fields or ``None`` if unknown
+        """
+
+        indexed = self._index_generation == self._storage.generation
+        self._storage.write(values, eids)
+
+        # The callers have updated the indexes already
+        if indexed:
+            self._index_generation = self._storage.generation
+
+        for index in itervalues(self._indexes):
+            index.flush()
+
+        with self._cache_lock:
+            if eids is None or not self._caching():
+                self._query_cache.clear()
+            else:
+                self._update_cache(values, eids, fields)
+
+        self._publish()
+
+    def _update_cache(self, data, eids, fields):
+        """
+        Bring the cached query results up to date after some elements have
+        been inserted, changed or removed.
+
+        Queries not reading any of the changed ``fields`` aren't tested
+        again. For the other queries only the changed elements are tested
+        again and the result is patched if they now (don't) match. Changed
+        elements that have been replaced by copies (see :meth:`_changing`)
+        are replaced in all results.
         """
 
-        self._query_cache.clear()
-        self._storage.write(values)
+        if fields is not None:
+            fields = set(fields)
+
+        for cond in list(self._query_cache):
+            entry = self._query_cache.cache.get(cond)
+            if entry is None:
+                # Evicted while patching another entry
+                continue
+
+            elements, matched, paths = entry
+            added, removed = [], set()
+
+            if fields is None or paths is None or \
+                    any(path[0] in fields for path in paths if path):
+                test = compile_query(cond)
+
+                try:
+                    for eid in eids:
+                        element = data.get(eid)
+                        matches = element is not None and bool(test(element))
+
+                        if matches and eid not in matched:
+                            added.append(element)
+                        elif not matches and eid in matched:
+                            removed.add(eid)
+                except Exception:
+                    del self._query_cache[cond]
+                    continue
+
+            kept = matched.intersection(eids).difference(removed)
+            replaced = kept and any(
+                element is not data[element.eid] for element in elements
+                if element.eid in kept
+            )
+
+            if not added and not removed and not replaced:
+                continue
+
+            # Results that have been handed out must not change
+            elements = [data[element.eid] if element.eid in kept else element
+                        for element in elements
+                        if element.eid not in removed] + added
+            elements.sort(key=lambda element: element.eid)
+
+            matched = (matched - removed).union(el.eid for el in added)
+            self._query_cache[cond] = (elements, matched, paths)
 
     def __len__(self):
         """
         Get the total number of elements in the table.
         """
-        return len(self._read())
+        self._sync()
+
+        view = self._ready_view()
+        if view is not None:
+            return len(view.data)
+
+        with self._storage.mutex:
+            return self._storage.count()
 
     def all(self):
         """
@@ -300,7 +1331,7 @@ class Table(object):
         :rtype: list[Element]
         """
 
-        return list(itervalues(self._read()))
+        return list(itervalues(self._view().data))
 
     def insert(self, element):
         """
@@ -310,14 +1341,26 @@ class Table(object):
         :returns: the inserted element's ID
         """
 
-        eid = self._get_next_id()
-
-        if not isinstance(element, dict):
+        if not isinstance(element, Mapping):
             raise ValueError('Element is not a dictionary')
 
-        data = self._read()
-        data[eid] = element
-        self._write(data)
+        with self._storage.lock():
+            # Read first, another process may have used the next ID
+            data, indexes = self._editable()
+            eid = self._get_next_id()
+
+            try:
+                data[eid] = self._storage.element(element, eid)
+
+                for index in indexes:
+                    index.add(eid, data[eid])
+
+                self._write(data, [eid])
+            except Exception:
+                # Storages may share their objects with the snapshot
+                data.pop(eid, None)
+                self._discard_changes()
+                raise
 
         return eid
 
@@ -330,15 +1373,27 @@ class Table(object):
         """
 
         eids = []
-        data = self._read()
 
-        for element in elements:
-            eid = self._get_next_id()
-            eids.append(eid)
+        with self._storage.lock():
+            data, indexes = self._editable()
 
-            data[eid] = element
+            try:
+                for element in elements:
+                    eid = self._get_next_id()
+                    eids.append(eid)
+
+                    data[eid] = self._storage.element(element, eid)
 
-        self._write(data)
+                    for index in indexes:
+                        index.add(eid, data[eid])
+
+                self._write(data, eids)
+            except Exception:
+                # Storages may share their objects with the snapshot
+                for eid in eids:
+                    data.pop(eid, None)
+                self._discard_changes()
+                raise
 
         return eids
 
@@ -371,23 +1426,30 @@ class Table(object):
         """
 
         if callable(fields):
-            return self.process_elements(
-                lambda data, eid: fields(data[eid]),
-                cond, eids
-            )
+            def change(data, eid):
+                fields(self._changing(data, eid, True))
+                self._changed(data, eid)
+
+            return self.process_elements(change, cond, eids)
         else:
-            return self.process_elements(
-                lambda data, eid: data[eid].update(fields),
-                cond, eids
-            )
+            def change(data, eid):
+                self._changing(data, eid).update(fields)
+                self._changed(data, eid)
+
+            return self.process_elements(change, cond, eids,
+                                         fields=list(fields))
 
     def purge(self):
         """
         Purge the table by removing all elements.
         """
 
-        self._write({})
-        self._last_id = 0
+        with self._storage.lock():
+            for index in self._editable()[1]:
+                index.clear()
+
+            self._write({})
+            self._last_id = 0
 
     def search(self, cond):
         """
@@ -400,14 +1462,313 @@ class Table(object):
         :rtype: list[Element]
         """
 
-        if cond in self._query_cache:
-            return self._query_cache[cond]
-
-        elements = [element for element in self.all() if cond(element)]
-        self._query_cache[cond] = elements
+        self._sync()
+        caching = self._caching()
+
+        if caching:
+            with self._cache_lock:
+                cached = self._query_cache.get(cond)
+            if cached is not None:
+                return cached[0]
+
+        view = self._view()
+        elements = [view.data[eid] for eid in
+                    self._matching(cond, view.data, view.indexes)]
+
+        if caching:
+            paths = cond.paths() if hasattr(cond, 'paths') else None
+            with self._cache_lock:
+                # Another thread may have written since the view was taken
+                if view.generation == self._storage.generation:
+                    self._query_cache[cond] = (
+                        elements, set(element.eid for element in elements),
+                        paths
+                    )
 
         return elements
 
+    def iter_search(self, cond, limit=None, offset=0):
+        """
+        Iterate over the elements matching a 'where' cond.
+
+        Unlike :meth:`search`, the elements are yielded as soon as they are
+        found and the search stops after ``limit`` elements. The results
+        aren't stored in the query cache.
+
+        >>> for shot in table.iter_search(where('status') == 'wip', limit=20):
+        ...     print(shot['name'])
+
+        :param cond: the condition to check against
+        :type cond: Query
+        :param limit: the maximum number of elements to yield
+        :param offset: the number of matching elements to skip first
+        :rtype: generator[Element]
+        """
+
+        view = self._view()
+        stop = None if limit is None else offset + limit
+
+        for eid in islice(self._matching(cond, view.data, view.indexes),
+                          offset, stop):
+            yield view.data[eid]
+
+    def parallel_search(self, cond, workers=None):
+        """
+        Search for all elements matching a 'where' cond in a pool of
+        processes.
+
+        The elements to test are split into ranges of element IDs which are
+        tested by forked processes (see :mod:`tinydb.parallel`). Worth it for
+        full scans of large tables, small tables and queries that can't be
+        sent to other processes (like ``Query.test`` with a lambda) are
+        searched like :meth:`search` does. The results aren't stored in the
+        query cache.
+
+        >>> table.parallel_search(where('log').search('Segmentation fault'),
+        ...                       workers=8)
+
+        :param cond: the condition to check against
+        :type cond: Query
+        :param workers: the number of processes, by default one per CPU
+        :returns: list of matching elements, ordered by their IDs
+        :rtype: list[Element]
+        """
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        view = self._view()
+        plan = self._plan(cond, view.data, view.indexes)
+
+        if plan.source is None:
+            eids, filters = sorted(view.data), [cond]
+        else:
+            eids, filters = sorted(plan.source.candidates()), plan.filters
+
+        if not filters:
+            return [view.data[eid] for eid in eids]
+
+        descriptions = [parallel.describe_query(test) for test in filters]
+
+        matching = None
+        if workers > 1 and len(eids) >= parallel.MIN_ROWS and \
+                None not in descriptions:
+            description = descriptions[0] if len(descriptions) == 1 else \
+                ('and', descriptions)
+            matching = parallel.scan(view.data, eids, description, workers)
+
+        if matching is None:
+            matching = self._matching(cond, view.data, view.indexes)
+
+        return [view.data[eid] for eid in matching]
+
+    def select(self, fields, where=None):
+        """
+        Get the values of some fields of all (matching) elements.
+
+        Returns plain tuples instead of elements, fields an element doesn't
+        have are ``None``.
+
+        >>> table.select(['name', 'status'], where=where('type') == 'shot')
+        [('sh010', 'wip'), ('sh020', 'final')]
+
+        :param fields: the fields' names or lists of keys for nested fields
+        :param where: only select from elements matching this condition
+        :type where: Query
+        :rtype: list[tuple]
+        """
+
+        paths = [self._index_path(field) for field in fields]
+        view = self._view()
+        data = view.data
+
+        if where is None:
+            eids = list(data)
+        else:
+            eids = self._matching(where, data, view.indexes)
+
+        rows = []
+        for eid in eids:
+            element = data[eid]
+            row = []
+
+            for path in paths:
+                value = resolve_path(element, path)
+                row.append(None if value is MISSING else value)
+
+            rows.append(tuple(row))
+
+        return rows
+
+    def aggregate(self, group_by=None, count=True, sum=None, where=None):
+        """
+        Count and sum up the (matching) elements in a single pass.
+
+        >>> table.aggregate(group_by='status', count=True, sum='frames')
+        {'wip': {'count': 12, 'sum': 1450}, 'final': {'count': 3, 'sum': 96}}
+        >>> table.aggregate(sum='frames', where=where('type') == 'shot')
+        {'count': 15, 'sum': 1546}
+
+        Elements that don't have the ``group_by`` field are left out,
+        missing ``sum`` fields are skipped. List values are grouped as
+        tuples. If ``group_by`` has a :class:`~tinydb.indexes.HashIndex`,
+        its buckets are used as the groups. Without ``group_by``, a ``sum``
+        field having a :class:`~tinydb.indexes.ColumnIndex` is summed up by
+        the index.
+
+        :param group_by: the field to group by or ``None`` for a single
+                         result
+        :param count: count the elements
+        :param sum: the field whose values to sum up
+        :param where: only aggregate elements matching this condition
+        :type where: Query
+        :returns: the results per group or the result if there is no
+                  ``group_by``
+        :rtype: dict
+        """
+
+        view = self._view()
+        data = view.data
+        group_path = None if group_by is None else self._index_path(group_by)
+        sum_path = None if sum is None else self._index_path(sum)
+
+        column = view.indexes.get((sum_path, ColumnIndex))
+
+        if column is not None and group_path is None:
+            eids = None if where is None else \
+                set(self._matching(where, data, view.indexes))
+
+            total = column.sum(eids)
+            if total is not None:
+                result = self._empty_aggregate(count, sum_path)
+                result['sum'] = total
+                if count:
+                    result['count'] = len(data) if eids is None else len(eids)
+
+                return result
+
+        results = {}
+
+        def add(key, element):
+            result = results.get(key)
+            if result is None:
+                result = results[key] = self._empty_aggregate(count, sum_path)
+
+            if count:
+                result['count'] += 1
+
+            if sum_path is not None:
+                value = resolve_path(element, sum_path)
+                if value is not MISSING:
+                    result['sum'] += value
+
+        index = view.indexes.get((group_path, HashIndex))
+
+        if index is not None and where is None:
+            for key, eids in index.items():
+                if sum_path is None:
+                    results[key] = {'count': len(eids)} if count else {}
+                    continue
+
+                for eid in eids:
+                    add(key, data[eid])
+
+            eids = index.unhashable
+        elif where is None:
+            eids = list(data)
+        else:
+            eids = self._matching(where, data, view.indexes)
+
+        for eid in eids:
+            element = data[eid]
+
+            if group_path is None:
+                add(None, element)
+                continue
+
+            value = resolve_path(element, group_path)
+            if value is not MISSING:
+                add(freeze(value), element)
+
+        if group_path is None:
+            return results.get(None) or self._empty_aggregate(count, sum_path)
+
+        return results
+
+    @staticmethod
+    def _empty_aggregate(count, sum_path):
+        result = {}
+
+        if count:
+            result['count'] = 0
+        if sum_path is not None:
+            result['sum'] = 0
+
+        return result
+
+    def order_by(self, field, cond=None, limit=None, reverse=False):
+        """
+        Get the elements sorted by a field.
+
+        Elements that don't have the field are left out. Numbers come before
+        strings, values that can't be ordered come last.
+
+        If the field has a :class:`~tinydb.indexes.SortedIndex`, the index is
+        walked in order and the walk stops as soon as ``limit`` elements
+        have been found. Range tests on the field in ``cond`` limit the part
+        of the index that is walked.
+
+        >>> table.order_by('frame', where('frame') >= 1001, limit=10)
+
+        :param field: the field's name or a list of keys for nested fields
+        :param cond: only return elements matching this condition
+        :type cond: Query
+        :param limit: the maximum number of elements to return
+        :param reverse: sort from the largest to the smallest value
+        :returns: list of matching elements
+        :rtype: list[Element]
+        """
+
+        path = self._index_path(field)
+        view = self._view()
+        data = view.data
+
+        index = view.indexes.get((path, SortedIndex))
+
+        if index is not None:
+            hashval = getattr(cond, 'hashval', None)
+            hashvals = list(_and_leaves(hashval)) if hashval else ()
+            test = compile_query(cond)
+
+            elements = []
+            for eid in index.walk(hashvals, reverse):
+                if limit is not None and len(elements) >= limit:
+                    break
+
+                if cond is None or test(data[eid]):
+                    elements.append(data[eid])
+
+            return elements
+
+        if cond is None:
+            eids = list(data)
+        else:
+            eids = list(self._matching(cond, data, view.indexes))
+
+        def sort_key(eid):
+            value = resolve_path(data[eid], path)
+            group = sort_group(value)
+
+            if group is None:
+                return 3, eid
+            return group, value, eid
+
+        eids = [eid for eid in eids
+                if resolve_path(data[eid], path) is not MISSING]
+        eids.sort(key=sort_key, reverse=reverse)
+
+        return [data[eid] for eid in eids[:limit]]
+
     def get(self, cond=None, eid=None):
         """
         Get exactly one element specified by a query or and ID.
@@ -427,13 +1788,29 @@ class Table(object):
         # specific element
 
         if eid is not None:
-            # Element specified by ID
-            return self._read().get(eid, None)
+            # Element specified by ID, only decodes this element if the
+            # storage supports it (see LazyElements)
+            return self._view().data.get(eid, None)
 
         # Element specified by condition
-        for element in self.all():
-            if cond(element):
-                return element
+        for element in self.iter_search(cond, limit=1):
+            return element
+
+    def get_many(self, eids):
+        """
+        Get several elements by their IDs.
+
+        >>> table.get_many([1, 5, 99])
+        [{'name': 'nuke', ...}, {'name': 'maya', ...}, None]
+
+        :param eids: the elements' IDs
+        :returns: the elements in the order of ``eids``, ``None`` for
+                  missing ones
+        :rtype: list[Element | None]
+        """
+
+        data = self._view().data
+        return [data.get(eid, None) for eid in eids]
 
     def count(self, cond):
         """
@@ -459,11 +1836,33 @@ class Table(object):
         """
 
         if eids is not None:
-            # Elements specified by ID
-            return any(self.get(eid=eid) for eid in eids)
+            # Elements specified by ID, doesn't decode them
+            data = self._view().data
+            return any(eid in data for eid in eids)
 
         # Element specified by condition
         return self.get(cond) is not None
 
+
+def _cache_entry_size(entry):
+    """
+    Estimate the memory used by a query cache entry.
+    """
+
+    return sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+
+
+def _and_leaves(hashval):
+    """
+    Split a query hash value into the parts that all have to match.
+    """
+
+    if hashval[0] == 'and':
+        for part in hashval[1]:
+            for leaf in _and_leaves(part):
+                yield leaf
+    else:
+        yield hashval
+
 # Set the default table class
 TinyDB.table_class = Table
@@ -0,0 +1,977 @@
+"""
+Contains the :class:`base class <tinydb.indexes.Index>` for secondary indexes
+and implementations.
+
+Indexes map the values of a single field to the IDs of the elements having
+that value. A table keeps its indexes up to date on every write and asks them
+for candidates when running a query:
+
+>>> table.create_index('type')
+>>> table.search(where('type') == 'application')  # Uses the index
+>>> table.create_index('frame', SortedIndex)
+>>> table.search(where('frame') >= 1001)  # Uses the index
+>>> table.create_index('memory', ColumnIndex)
+>>> table.search(where('memory') > 4096)  # Compares all values at once
+>>> table.create_index('comment', TextIndex)
+>>> table.search(where('comment').search('retime'))  # Uses the index
+"""
+
+from bisect import bisect_left, bisect_right
+import copy
+import operator
+import re
+import threading
+
+from tinydb.utils import (LRUCache, MISSING, FrozenDict, compile_regex, freeze,
+                          iteritems, resolve_path)
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Before Python 3.11
+    import sre_parse
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    _NUMBER_TYPES = (int, long, float)
+    _STRING_TYPES = (str, unicode)
+except NameError:  # Python 3
+    _NUMBER_TYPES = (int, float)
+    _STRING_TYPES = (str,)
+
+#: The operations a :class:`SortedIndex` can answer
+RANGE_OPERATIONS = ('==', '<', '<=', '>', '>=')
+
+#: The operations a :class:`ColumnIndex` can answer
+COLUMN_OPERATIONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Larger integers can't be stored as floats without losing precision
+_MAX_EXACT_INT = 2 ** 53
+
+#: The operations a :class:`TextIndex` can answer
+TEXT_OPERATIONS = ('matches', 'search')
+
+# The literals the patterns of text queries require, see required_literals
+_literals_cache = LRUCache(capacity=256)
+_literals_lock = threading.Lock()
+
+# Case insensitive patterns match the dotted and the dotless I for an i,
+# but they don't fold to a single i
+_FOLD_I = {0x130: u'i', 0x131: u'i'}
+
+
+def sort_group(value):
+    """
+    Get the group of values ``value`` can be ordered with.
+
+    Numbers are only comparable to numbers and strings to strings, so a
+    sorted index keeps one sorted list per group. Python 2 can't compare
+    byte strings with non-ASCII characters to unicode, they get a group of
+    their own.
+
+    :returns: ``0`` for numbers, ``1`` for strings, ``2`` for non-ASCII byte
+              strings and ``None`` for values that can't be ordered
+    """
+    if isinstance(value, _NUMBER_TYPES):
+        # NaN isn't equal to itself and breaks sorting
+        return 0 if value == value else None
+    if isinstance(value, _STRING_TYPES):
+        return 2 if isinstance(value, bytes) and mixed_text(value) else 1
+    return None
+
+
+def mixed_text(value):
+    """
+    Check whether Python 2 compares a text to texts of the other string type
+    by decoding it (see :meth:`Query.__eq__ <tinydb.queries.Query.__eq__>`).
+
+    Equal byte strings and unicode texts with non-ASCII characters neither
+    hash nor sort the same, so indexes leave queries for them to a scan.
+    """
+    return (bytes is str and isinstance(value, _STRING_TYPES) and
+            any(ord(char) > 127 for char in value))
+
+
+class Index(object):
+    """
+    The base class for all indexes.
+
+    An index is built for a field given as a path of keys (like
+    :attr:`Query.path <tinydb.queries.Query>`) and answers lookups for query
+    hash values (see :class:`~tinydb.queries.QueryImpl`).
+    """
+
+    def __init__(self, path):
+        self.path = tuple(path)
+
+    def build(self, data):
+        """
+        Rebuild the index from all elements of a table.
+
+        :param data: the table's elements, keyed by their IDs
+        :type data: dict
+        """
+        self.clear()
+
+        for eid, element in iteritems(data):
+            self.add(eid, element)
+
+    def clear(self):
+        """
+        Remove all entries from the index.
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def copy(self):
+        """
+        Copy the index. Changing the copy doesn't change this index.
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def add(self, eid, element):
+        """
+        Add an element to the index.
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def remove(self, eid):
+        """
+        Remove an element from the index.
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def flush(self):
+        """
+        Reorganize the index after the changes made by :meth:`add` and
+        :meth:`remove`.
+
+        Called by the table with the lock held once a write is done. Lookups
+        never change the index, readers of other threads may use it.
+        """
+
+    def supports(self, hashval):
+        """
+        Check whether the index can answer a query.
+
+        :param hashval: the hash value of a query
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def estimate(self, hashvals):
+        """
+        Estimate the number of candidates :meth:`lookup_all` will return
+        without looking them up.
+
+        :param hashvals: the hash values of supported queries
+        :rtype: int
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def is_exact(self, hashvals):
+        """
+        Check whether the candidates for ``hashvals`` are exactly the elements
+        matching all of the queries, so they don't have to be tested.
+
+        :param hashvals: the hash values of supported queries
+        """
+        return False
+
+    def lookup(self, hashval):
+        """
+        Find the candidates for a query.
+
+        :param hashval: the hash value of a query that tests this index's
+                        field
+        :returns: a set containing the IDs of all elements that may match the
+                  query or ``None`` if the index can't answer the query
+        :rtype: set | None
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def lookup_all(self, hashvals):
+        """
+        Find the candidates for several queries that all have to match.
+
+        :param hashvals: the hash values of queries testing this index's
+                         field
+        :returns: a set of element IDs or ``None`` if the index can't answer
+                  any of the queries
+        :rtype: set | None
+        """
+        candidates = None
+
+        for hashval in hashvals:
+            eids = self.lookup(hashval)
+            if eids is not None:
+                candidates = eids if candidates is None else candidates & eids
+
+        return candidates
+
+
+class HashIndex(Index):
+    """
+    An index answering equality queries.
+    """
+
+    def __init__(self, path):
+        super(HashIndex, self).__init__(path)
+
+        self._buckets = {}
+        self._keys = {}
+
+        # Elements whose value can't be hashed are candidates for every query
+        self._unhashable = set()
+
+    def clear(self):
+        self._buckets.clear()
+        self._keys.clear()
+        self._unhashable.clear()
+
+    def copy(self):
+        index = copy.copy(self)
+        index._buckets = dict((key, set(eids))
+                              for key, eids in iteritems(self._buckets))
+        index._keys = dict(self._keys)
+        index._unhashable = set(self._unhashable)
+
+        return index
+
+    def add(self, eid, element):
+        value = resolve_path(element, self.path)
+        if value is MISSING:
+            return
+
+        key = freeze(value)
+        try:
+            self._buckets.setdefault(key, set()).add(eid)
+        except TypeError:
+            self._unhashable.add(eid)
+        else:
+            self._keys[eid] = key
+
+    def remove(self, eid):
+        self._unhashable.discard(eid)
+
+        key = self._keys.pop(eid, MISSING)
+        if key is MISSING:
+            return
+
+        bucket = self._buckets[key]
+        bucket.discard(eid)
+        if not bucket:
+            del self._buckets[key]
+
+    def items(self):
+        """
+        Iterate over the (frozen) values of the field and the IDs of the
+        elements having them.
+
+        Elements whose value can't be hashed are left out, see
+        :attr:`unhashable`.
+        """
+        return iteritems(self._buckets)
+
+    @property
+    def unhashable(self):
+        """
+        The IDs of the elements whose value can't be hashed.
+        """
+        return set(self._unhashable)
+
+    def supports(self, hashval):
+        return (hashval[0] == '==' and hashval[1] == self.path and
+                not mixed_text(hashval[2]))
+
+    def _bucket(self, hashval):
+        try:
+            return self._buckets.get(hashval[2], ())
+        except TypeError:
+            return ()
+
+    def estimate(self, hashvals):
+        return min(len(self._bucket(hashval)) for hashval in hashvals) + \
+            len(self._unhashable)
+
+    def is_exact(self, hashvals):
+        # Containers are frozen to be hashable, so a frozen list matches
+        # lists and tuples alike
+        return not self._unhashable and not any(
+            isinstance(hashval[2], (tuple, FrozenDict)) for hashval in hashvals
+        )
+
+    def lookup(self, hashval):
+        if not self.supports(hashval):
+            return None
+
+        return set(self._bucket(hashval)) | self._unhashable
+
+
+class SortedIndex(Index):
+    """
+    An index answering equality and range queries.
+
+    Keeps the values of the field in sorted lists, so ``<``, ``<=``, ``>``
+    and ``>=`` tests (and combinations of them using ``&``) are answered by
+    bisection. The index can also be walked in order, see
+    :meth:`Table.order_by <tinydb.database.Table.order_by>`.
+    """
+
+    def __init__(self, path):
+        super(SortedIndex, self).__init__(path)
+
+        # Maps sort groups to a sorted list of values and a list of the
+        # element IDs at the same positions
+        self._groups = {}
+        self._keys = {}
+
+        # Elements whose value can't be ordered are candidates for every query
+        self._unordered = set()
+
+    def clear(self):
+        self._groups.clear()
+        self._keys.clear()
+        self._unordered.clear()
+
+    def copy(self):
+        index = copy.copy(self)
+        index._groups = dict((group, (list(values), list(eids)))
+                             for group, (values, eids) in
+                             iteritems(self._groups))
+        index._keys = dict(self._keys)
+        index._unordered = set(self._unordered)
+
+        return index
+
+    def add(self, eid, element):
+        value = resolve_path(element, self.path)
+        if value is MISSING:
+            return
+
+        group = sort_group(value)
+        if group is None:
+            self._unordered.add(eid)
+            return
+
+        values, eids = self._groups.setdefault(group, ([], []))
+        pos = bisect_right(values, value)
+        # Keep the element IDs of equal values sorted
+        pos = bisect_left(eids, eid, bisect_left(values, value), pos)
+
+        values.insert(pos, value)
+        eids.insert(pos, eid)
+        self._keys[eid] = (group, value)
+
+    def remove(self, eid):
+        self._unordered.discard(eid)
+
+        key = self._keys.pop(eid, MISSING)
+        if key is MISSING:
+            return
+
+        group, value = key
+        values, eids = self._groups[group]
+        pos = bisect_left(eids, eid, bisect_left(values, value),
+                          bisect_right(values, value))
+
+        del values[pos]
+        del eids[pos]
+
+    def supports(self, hashval):
+        return (hashval[0] in RANGE_OPERATIONS and hashval[1] == self.path and
+                sort_group(hashval[-1]) is not None)
+
+    def estimate(self, hashvals):
+        bounds = self._bounds(hashvals)
+        total = len(self._keys) + len(self._unordered)
+
+        if bounds is None:
+            return total
+
+        group, start, stop = bounds
+        return total - len(self._groups.get(group, ([], []))[1]) + stop - start
+
+    def is_exact(self, hashvals):
+        bounds = self._bounds(hashvals)
+        if bounds is None or self._unordered:
+            return False
+
+        # Values of other groups are left to the query
+        return all(group == bounds[0] or not eids
+                   for group, (_, eids) in iteritems(self._groups))
+
+    def lookup(self, hashval):
+        return self.lookup_all([hashval])
+
+    def lookup_all(self, hashvals):
+        if not any(self.supports(hashval) for hashval in hashvals):
+            return None
+
+        bounds = self._bounds(hashvals)
+        if bounds is None:
+            # Bounds of different groups, leave it to the query
+            return set(self._keys) | self._unordered
+
+        group, start, stop = bounds
+        candidates = set(self._unordered)
+
+        for other, (values, eids) in iteritems(self._groups):
+            if other == group:
+                candidates.update(eids[start:stop])
+            else:
+                # Comparing values from different groups will either fail or
+                # use Python 2's arbitrary ordering, leave it to the query
+                candidates.update(eids)
+
+        return candidates
+
+    def walk(self, hashvals=(), reverse=False):
+        """
+        Iterate over the element IDs ordered by their values.
+
+        Numbers come before strings, values that can't be ordered come last.
+
+        :param hashvals: hash values of range queries on this index's field
+                         that limit the walked range
+        :param reverse: walk from the largest to the smallest value
+        """
+        bounds = self._bounds(hashvals) if hashvals else None
+
+        parts = []
+        for group in sorted(self._groups):
+            eids = self._groups[group][1]
+
+            if bounds is not None and bounds[0] == group:
+                eids = eids[bounds[1]:bounds[2]]
+
+            parts.append(eids)
+
+        parts.append(sorted(self._unordered))
+
+        return self._iter_parts(parts, reverse)
+
+    @staticmethod
+    def _iter_parts(parts, reverse):
+        if reverse:
+            parts = [reversed(part) for part in reversed(parts)]
+
+        for part in parts:
+            for eid in part:
+                yield eid
+
+    def _bounds(self, hashvals):
+        """
+        Combine range queries into a single slice of one sort group.
+
+        :returns: a tuple of the sort group, the first and the last (excluded)
+                  position or ``None`` if the queries can't be combined
+        """
+        group = lower = upper = None
+
+        for hashval in hashvals:
+            op, path, rhs = hashval[0], hashval[1], hashval[-1]
+            if op not in RANGE_OPERATIONS or path != self.path:
+                continue
+
+            rhs_group = sort_group(rhs)
+            if rhs_group is None or group not in (None, rhs_group):
+                return None
+            group = rhs_group
+
+            if op in ('==', '>', '>='):
+                bound = (rhs, op != '>')
+                if lower is None or bound[0] > lower[0] or (
+                        bound[0] == lower[0] and not bound[1]):
+                    lower = bound
+
+            if op in ('==', '<', '<='):
+                bound = (rhs, op != '<')
+                if upper is None or bound[0] < upper[0] or (
+                        bound[0] == upper[0] and not bound[1]):
+                    upper = bound
+
+        if group is None:
+            return None
+
+        values = self._groups.get(group, ([], []))[0]
+
+        if lower is None:
+            start = 0
+        elif lower[1]:
+            start = bisect_left(values, lower[0])
+        else:
+            start = bisect_right(values, lower[0])
+
+        if upper is None:
+            stop = len(values)
+        elif upper[1]:
+            stop = bisect_right(values, upper[0])
+        else:
+            stop = bisect_left(values, upper[0])
+
+        return group, start, max(start, stop)
+
+
+def column_number(value):
+    """
+    Get the number a :class:`ColumnIndex` stores for a value.
+
+    :returns: the value as a float or ``None`` if it isn't a number or can't
+              be stored as a float exactly
+    """
+    if not isinstance(value, _NUMBER_TYPES):
+        return None
+
+    if not isinstance(value, float) and abs(value) > _MAX_EXACT_INT:
+        return None
+
+    return float(value)
+
+
+class ColumnIndex(Index):
+    """
+    An index keeping the numbers of a field in NumPy arrays.
+
+    The values are stored in an array of floats next to an array of the
+    element IDs. Comparisons (``==``, ``!=``, ``<``, ``<=``, ``>``, ``>=``
+    and combinations of them using ``&``) are answered by comparing the
+    whole array at once and :meth:`sum` adds up the values the same way.
+    Values that aren't numbers are candidates for every query.
+
+    See the ``columns`` option of :meth:`TinyDB.table
+    <tinydb.database.TinyDB.table>`. Requires NumPy.
+    """
+
+    def __init__(self, path):
+        if numpy is None:
+            raise RuntimeError('ColumnIndex requires NumPy')
+
+        super(ColumnIndex, self).__init__(path)
+        self.clear()
+
+    def clear(self):
+        # Removed values get the element ID -1
+        self._eids = numpy.zeros(0, dtype=numpy.int64)
+        self._values = numpy.zeros(0, dtype=numpy.float64)
+        self._removed = 0
+
+        # Added values are collected in lists and appended to the arrays
+        # once there are enough of them (see flush)
+        self._added_eids = []
+        self._added_values = []
+
+        self._positions = {}
+
+        # Elements whose value is a float, sums are floats then
+        self._floats = set()
+
+        # Elements whose value isn't a number
+        self._other = set()
+
+    def copy(self):
+        index = copy.copy(self)
+        index._eids = self._eids.copy()
+        index._values = self._values.copy()
+        index._added_eids = list(self._added_eids)
+        index._added_values = list(self._added_values)
+        index._positions = dict(self._positions)
+        index._floats = set(self._floats)
+        index._other = set(self._other)
+
+        return index
+
+    def build(self, data):
+        self.clear()
+
+        eids, values = [], []
+        for eid, element in iteritems(data):
+            value = resolve_path(element, self.path)
+            if value is MISSING:
+                continue
+
+            number = column_number(value)
+            if number is None:
+                self._other.add(eid)
+                continue
+
+            eids.append(eid)
+            values.append(number)
+
+            if isinstance(value, float):
+                self._floats.add(eid)
+
+        self._eids = numpy.array(eids, dtype=numpy.int64)
+        self._values = numpy.array(values, dtype=numpy.float64)
+        self._positions = dict(zip(eids, range(len(eids))))
+
+    def add(self, eid, element):
+        value = resolve_path(element, self.path)
+        if value is MISSING:
+            return
+
+        number = column_number(value)
+        if number is None:
+            self._other.add(eid)
+            return
+
+        self._positions[eid] = len(self._eids) + len(self._added_eids)
+        self._added_eids.append(eid)
+        self._added_values.append(number)
+
+        if isinstance(value, float):
+            self._floats.add(eid)
+
+    def remove(self, eid):
+        self._other.discard(eid)
+        self._floats.discard(eid)
+
+        pos = self._positions.pop(eid, None)
+        if pos is None:
+            return
+
+        if pos < len(self._eids):
+            self._eids[pos] = -1
+        else:
+            self._added_eids[pos - len(self._eids)] = -1
+        self._removed += 1
+
+    def flush(self):
+        """
+        Append the added values to the arrays once they make up a sixteenth
+        of them and drop the removed ones if they take up more than half of
+        the arrays.
+        """
+        if len(self._added_eids) >= max(256, len(self._eids) // 16):
+            self._eids = numpy.concatenate((
+                self._eids, numpy.array(self._added_eids, dtype=numpy.int64)
+            ))
+            self._values = numpy.concatenate((
+                self._values,
+                numpy.array(self._added_values, dtype=numpy.float64)
+            ))
+            self._added_eids = []
+            self._added_values = []
+
+        if self._removed > 64 and self._removed * 2 > len(self._eids):
+            kept = self._eids >= 0
+
+            self._eids = self._eids[kept]
+            self._values = self._values[kept]
+            self._removed = 0
+
+            self._positions = dict(zip(self._eids.tolist(),
+                                       range(len(self._eids))))
+
+    def _arrays(self):
+        """
+        Get the arrays of element IDs and values, followed by the ones added
+        since the last :meth:`flush`.
+
+        :returns: a list of pairs of arrays
+        """
+        arrays = [(self._eids, self._values)]
+
+        if self._added_eids:
+            arrays.append((numpy.array(self._added_eids, dtype=numpy.int64),
+                           numpy.array(self._added_values,
+                                       dtype=numpy.float64)))
+
+        return arrays
+
+    def supports(self, hashval):
+        return (hashval[0] in COLUMN_OPERATIONS and
+                hashval[1] == self.path and
+                column_number(hashval[-1]) is not None)
+
+    def _mask(self, hashvals):
+        """
+        Compare the values to all supported queries.
+
+        :returns: pairs of the element IDs and arrays telling which of them
+                  match (see :meth:`_arrays`) or ``None`` if no query is
+                  supported
+        """
+        hashvals = [hashval for hashval in hashvals if self.supports(hashval)]
+        if not hashvals:
+            return None
+
+        masked = []
+        for eids, values in self._arrays():
+            mask = eids >= 0
+            for hashval in hashvals:
+                mask &= COLUMN_OPERATIONS[hashval[0]](values, hashval[-1])
+            masked.append((eids, mask))
+
+        return masked
+
+    def estimate(self, hashvals):
+        masked = self._mask(hashvals)
+
+        if masked is None:
+            return len(self._positions) + len(self._other)
+
+        return sum(int(numpy.count_nonzero(mask))
+                   for _, mask in masked) + len(self._other)
+
+    def is_exact(self, hashvals):
+        return not self._other
+
+    def lookup(self, hashval):
+        return self.lookup_all([hashval])
+
+    def lookup_all(self, hashvals):
+        masked = self._mask(hashvals)
+        if masked is None:
+            return None
+
+        candidates = set(self._other)
+        for eids, mask in masked:
+            candidates.update(eids[mask].tolist())
+
+        return candidates
+
+    def sum(self, eids=None):
+        """
+        Add up the values.
+
+        :param eids: only add up the values of these elements
+        :type eids: set
+        :returns: the sum (a float if any value is a float) or ``None`` if
+                  some values aren't numbers
+        """
+        if self._other:
+            return None
+
+        if eids is not None:
+            selected = numpy.fromiter(eids, dtype=numpy.int64,
+                                      count=len(eids))
+
+        parts = []
+        for stored, values in self._arrays():
+            mask = stored >= 0
+            if eids is not None:
+                mask &= numpy.isin(stored, selected)
+            parts.append(values[mask])
+
+        values = numpy.concatenate(parts)
+
+        if self._floats and (eids is None or not self._floats.isdisjoint(eids)):
+            return float(values.sum())
+
+        return int(values.astype(numpy.int64).sum())
+
+
+def fold(text):
+    """
+    Fold the case of a text for a :class:`TextIndex`.
+
+    Case folding maps every character on its own, so the folded form of a
+    substring is a substring of the folded text.
+    """
+    if not hasattr(text, 'casefold'):  # Python 2
+        return text.lower()
+
+    return text.translate(_FOLD_I).casefold()
+
+
+def trigrams(text):
+    """
+    Get the (case folded) substrings of three characters of a text.
+
+    :rtype: set
+    """
+    text = fold(text)
+    return set(text[pos:pos + 3] for pos in range(len(text) - 2))
+
+
+def required_literals(pattern):
+    """
+    Find the texts every string matching a regular expression contains.
+
+    Only literal characters that follow each other and have to match
+    exactly once are combined, everything else (character sets, optional
+    parts, alternatives) ends a literal. Literals of case insensitive
+    patterns (and all patterns on Python 2) are only used if they are ASCII.
+
+    >>> required_literals('shot_[0-9]+_comp.*retime')
+    ['shot_', '_comp', 'retime']
+
+    :param pattern: the pattern or a compiled pattern
+    :returns: the literals or an empty list if the pattern can't be analyzed
+    :rtype: list
+    """
+    key = (type(pattern), pattern)
+
+    with _literals_lock:
+        literals = _literals_cache.get(key)
+    if literals is not None:
+        return literals
+
+    try:
+        compiled = compile_regex(pattern)
+        if not isinstance(compiled.pattern, _STRING_TYPES):
+            raise TypeError('Not a text pattern')
+
+        literals = _literals(sre_parse.parse(compiled.pattern, compiled.flags),
+                             type(compiled.pattern))
+
+        # Python 2 compares byte strings to unicode texts
+        if compiled.flags & re.IGNORECASE or bytes is str:
+            literals = [literal for literal in literals
+                        if all(ord(char) < 128 for char in literal)]
+    except Exception:
+        literals = []
+
+    with _literals_lock:
+        _literals_cache[key] = literals
+    return literals
+
+
+def _literals(parsed, text_type):
+    literals = []
+    run = []
+
+    def end_run():
+        if run:
+            literals.append(text_type().join(run))
+            del run[:]
+
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(_char(av, text_type))
+            continue
+
+        end_run()
+
+        if op == sre_parse.SUBPATTERN:
+            # The group and the flags set and removed inside the group
+            if len(av) == 2 or not (av[1] or av[2]):
+                literals.extend(_literals(av[-1], text_type))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            if av[0] >= 1:
+                literals.extend(_literals(av[2], text_type))
+
+    end_run()
+    return literals
+
+
+def _char(code, text_type):
+    try:
+        return unichr(code) if text_type is unicode else chr(code)
+    except NameError:  # Python 3
+        return chr(code)
+
+
+class TextIndex(Index):
+    """
+    An index answering regular expression queries on text fields.
+
+    Maps the (case folded) substrings of three characters (trigrams) of the
+    field's texts to the IDs of the elements containing them. A
+    :meth:`~tinydb.queries.Query.search` or
+    :meth:`~tinydb.queries.Query.matches` query is answered with the
+    elements containing all trigrams of the literal texts the pattern
+    requires (see :func:`required_literals`). The candidates are always
+    tested with the pattern.
+
+    >>> table.create_index('comment', TextIndex)
+    >>> table.search(where('comment').search('retime'))
+    >>> table.search(where('comment').search(re.escape(user_input)))
+
+    Patterns without a literal of three characters can't be answered.
+    Values that aren't texts are candidates for every query.
+    """
+
+    def __init__(self, path):
+        super(TextIndex, self).__init__(path)
+
+        self._postings = {}
+        self._keys = {}
+        self._other = set()
+
+    def clear(self):
+        self._postings.clear()
+        self._keys.clear()
+        self._other.clear()
+
+    def copy(self):
+        index = copy.copy(self)
+        index._postings = dict((key, set(eids))
+                               for key, eids in iteritems(self._postings))
+        index._keys = dict(self._keys)
+        index._other = set(self._other)
+
+        return index
+
+    def add(self, eid, element):
+        value = resolve_path(element, self.path)
+        if value is MISSING:
+            return
+
+        if not isinstance(value, _STRING_TYPES):
+            self._other.add(eid)
+            return
+
+        keys = trigrams(value)
+        postings = self._postings
+        for key in keys:
+            try:
+                postings[key].add(eid)
+            except KeyError:
+                postings[key] = set([eid])
+        self._keys[eid] = keys
+
+    def remove(self, eid):
+        self._other.discard(eid)
+
+        for key in self._keys.pop(eid, ()):
+            eids = self._postings[key]
+            eids.discard(eid)
+            if not eids:
+                del self._postings[key]
+
+    def _trigrams(self, hashval):
+        keys = set()
+        for literal in required_literals(hashval[2]):
+            keys.update(trigrams(literal))
+
+        return keys
+
+    def supports(self, hashval):
+        return (hashval[0] in TEXT_OPERATIONS and hashval[1] == self.path and
+                bool(self._trigrams(hashval)))
+
+    def estimate(self, hashvals):
+        sizes = [len(self._postings.get(key, ()))
+                 for hashval in hashvals if self.supports(hashval)
+                 for key in self._trigrams(hashval)]
+
+        if not sizes:
+            return len(self._keys) + len(self._other)
+
+        return min(sizes) + len(self._other)
+
+    def lookup(self, hashval):
+        if not self.supports(hashval):
+            return None
+
+        # Start with the rarest trigram, intersecting only iterates over it
+        postings = sorted((self._postings.get(key, set())
+                           for key in self._trigrams(hashval)), key=len)
+
+        candidates = set(postings[0])
+        for eids in postings[1:]:
+            if not candidates:
+                break
+            candidates &= eids
+
+        return candidates | self._other
@@ -2,7 +2,14 @@
 Contains the :class:`base class <tinydb.middlewares.Middleware>` for
 middlewares and implementations.
 """
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
 from tinydb import TinyDB
+from tinydb.storages import merge_tables
+from tinydb.utils import iteritems, itervalues
 
 
 class Middleware(object):
@@ -72,6 +79,39 @@ class Middleware(object):
 
         return getattr(self.__dict__['storage'], name)
 
+    # The table level accessors have to go through the middleware's read and
+    # write, otherwise __getattr__ would bypass the middleware
+
+    def table_names(self):
+        return set(self.read() or {})
+
+    def table_info(self, name):
+        return None
+
+    def read_table(self, name):
+        return (self.read() or {}).get(name)
+
+    def write_table(self, name, values, eids=None):
+        data = self.read() or {}
+        data[name] = values
+        self.write(data)
+
+    def purge_table(self, name):
+        data = self.read() or {}
+        if name in data:
+            del data[name]
+            self.write(data)
+
+    def write_tables(self, tables):
+        self.write(merge_tables(self.read(), tables))
+
+    def version(self):
+        return None
+
+    @contextmanager
+    def lock(self):
+        yield
+
 
 class CachingMiddleware(Middleware):
     """
@@ -80,37 +120,215 @@ class CachingMiddleware(Middleware):
     This Middleware aims to improve the performance of TinyDB by writing only
     the last DB state every :attr:`WRITE_CACHE_SIZE` time and reading always
     from cache.
+
+    If :attr:`MAX_DIRTY_AGE` or :attr:`MAX_DIRTY_BYTES` is set, a background
+    thread writes the cached state once the oldest unwritten change is that
+    old or the changed elements use that much memory (and when
+    :attr:`WRITE_CACHE_SIZE` is reached), so writing to the storage never
+    blocks the caller:
+
+    >>> db = TinyDB('db.json', storage=CachingMiddleware(JSONStorage,
+    ...                                                  max_dirty_age=5))
     """
 
     #: The number of write operations to cache before writing to disc
     WRITE_CACHE_SIZE = 1000
 
-    def __init__(self, storage_cls=TinyDB.DEFAULT_STORAGE):
+    #: The seconds after which unwritten changes are written in the
+    #: background or ``None``
+    MAX_DIRTY_AGE = None
+
+    #: The (estimated) size in bytes of the changed elements at which they
+    #: are written in the background or ``None``
+    MAX_DIRTY_BYTES = None
+
+    def __init__(self, storage_cls=TinyDB.DEFAULT_STORAGE, max_dirty_age=None,
+                 max_dirty_bytes=None):
+        """
+        :param storage_cls: The class of the storage to cache.
+        :param max_dirty_age: Overrides :attr:`MAX_DIRTY_AGE`.
+        :param max_dirty_bytes: Overrides :attr:`MAX_DIRTY_BYTES`.
+        """
+
         super(CachingMiddleware, self).__init__(storage_cls)
 
+        if max_dirty_age is not None:
+            self.MAX_DIRTY_AGE = max_dirty_age
+        if max_dirty_bytes is not None:
+            self.MAX_DIRTY_BYTES = max_dirty_bytes
+
         self.cache = None
         self._cache_modified_count = 0
+        self._dirty_since = None
+        self._dirty_bytes = 0
+
+        # Guards the cache and the counters, _flush_lock keeps the writes to
+        # the storage in order
+        self._lock = threading.Condition(threading.RLock())
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._flush_requested = False
+        self._closed = False
+
+    def _background(self):
+        return self.MAX_DIRTY_AGE is not None or \
+            self.MAX_DIRTY_BYTES is not None
 
     def read(self):
-        if self.cache is None:
-            self.cache = self.storage.read()
-        return self.cache
+        with self._lock:
+            if self.cache is None:
+                self.cache = self.storage.read()
+            return self.cache
 
     def write(self, data):
-        self.cache = data
+        with self._lock:
+            self.cache = data
+            self._changed(sum(_estimate_size(values)
+                              for values in itervalues(data)))
+
+    def write_table(self, name, values, eids=None):
+        with self._lock:
+            data = self.read() or {}
+            data[name] = values
+            self.cache = data
+
+            if eids is None:
+                size = _estimate_size(values)
+            else:
+                size = _estimate_size(values, eids)
+            self._changed(size)
+
+    def write_tables(self, tables):
+        with self._lock:
+            self.cache = merge_tables(self.read(), tables)
+            self._changed(sum(_estimate_size(*entry)
+                              for entry in itervalues(tables)
+                              if entry is not None))
+
+    def purge_table(self, name):
+        with self._lock:
+            data = self.read() or {}
+            if name in data:
+                del data[name]
+                self.cache = data
+                self._changed(0)
+
+    def _changed(self, size):
+        """
+        Count a change and trigger writing to the storage if necessary.
+        """
+
         self._cache_modified_count += 1
+        self._dirty_bytes += size
+        if self._dirty_since is None:
+            self._dirty_since = time.time()
+
+        full = self._cache_modified_count >= self.WRITE_CACHE_SIZE or (
+            self.MAX_DIRTY_BYTES is not None and
+            self._dirty_bytes >= self.MAX_DIRTY_BYTES
+        )
+
+        if not self._background():
+            if full:
+                self.flush()
+            return
+
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._run_flusher)
+            self._flusher.daemon = True
+            self._flusher.start()
+
+        if full:
+            self._flush_requested = True
+        self._lock.notify()
+
+    def _run_flusher(self):
+        """
+        Write the cache whenever it's due, until the middleware is closed.
+        """
+
+        while True:
+            with self._lock:
+                while not self._closed and not self._flush_due():
+                    self._lock.wait(self._flush_timeout())
+
+                if self._closed:
+                    return
+
+                self._flush_requested = False
+
+            try:
+                self.flush()
+            except Exception:
+                # Keep the changes and try again later instead of losing
+                # the thread
+                with self._lock:
+                    self._lock.wait(self.MAX_DIRTY_AGE or 1)
+
+    def _flush_due(self):
+        if self._flush_requested:
+            return True
+
+        return self.MAX_DIRTY_AGE is not None and \
+            self._dirty_since is not None and \
+            time.time() - self._dirty_since >= self.MAX_DIRTY_AGE
 
-        if self._cache_modified_count >= self.WRITE_CACHE_SIZE:
-            self.flush()
+    def _flush_timeout(self):
+        if self.MAX_DIRTY_AGE is None or self._dirty_since is None:
+            return None
+
+        return max(0, self._dirty_since + self.MAX_DIRTY_AGE - time.time())
 
     def flush(self):
         """
         Flush all unwritten data to disk.
         """
-        if self._cache_modified_count > 0:
-            self.storage.write(self.cache)
-            self._cache_modified_count = 0
+
+        with self._flush_lock:
+            with self._lock:
+                if self._cache_modified_count == 0:
+                    return
+
+                # The tables keep changing their dicts after writing them,
+                # copy them to get a consistent state
+                data = dict((name, dict(values))
+                            for name, values in iteritems(self.cache or {}))
+                count, size, since = (self._cache_modified_count,
+                                      self._dirty_bytes, self._dirty_since)
+
+                self._cache_modified_count = 0
+                self._dirty_bytes = 0
+                self._dirty_since = None
+
+            try:
+                self.storage.write(data)
+            except Exception:
+                with self._lock:
+                    self._cache_modified_count += count
+                    self._dirty_bytes += size
+                    if since is not None:
+                        self._dirty_since = min(self._dirty_since or since,
+                                                since)
+                raise
 
     def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+
+        if self._flusher is not None:
+            self._flusher.join()
+
         self.flush()  # Flush potentially unwritten data
         self.storage.close()
+
+
+def _estimate_size(values, eids=None):
+    """
+    Estimate the memory used by (some of) the elements of a table.
+    """
+
+    if eids is None:
+        return sum(sys.getsizeof(element) for element in itervalues(values))
+
+    return sum(sys.getsizeof(values[eid]) for eid in eids if eid in values)
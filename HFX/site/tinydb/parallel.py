@@ -0,0 +1,239 @@
+"""
+Runs queries on large tables in a pool of processes.
+
+A query is made of closures which can't be sent to other processes, so it's
+turned into a description built from the :attr:`hash values
+<tinydb.queries.QueryImpl.hashval>` of its parts that can be pickled:
+
+>>> describe_query((where('type') == 'render') & (where('mem') > 4096))
+('and', [('==', ('type',), 'render'), ('>', ('mem',), 4096)])
+>>> build_query(_)  # The same query again
+QueryImpl('and', frozenset({...}))
+
+The processes are forked, so they get the table's elements without copying
+them. Every process tests the elements of a range of element IDs and sends
+back the IDs of the matching ones. See :meth:`Table.parallel_search
+<tinydb.database.Table.parallel_search>`.
+
+Queries that can't be described (like :meth:`Query.test
+<tinydb.queries.Query.test>` with a lambda) are run in the current process.
+"""
+
+import multiprocessing
+import os
+import pickle
+import threading
+
+from tinydb import compiler, indexes, utils
+from tinydb.compiler import compile_query
+from tinydb.queries import Query, QueryImpl
+
+try:
+    _SCALAR_TYPES = (str, unicode, int, long, float, bool, type(None))
+except NameError:  # Python 3
+    _SCALAR_TYPES = (str, int, float, bool, type(None))
+
+__all__ = ('describe_query', 'build_query', 'scan')
+
+#: Tables with fewer candidates are searched in the current process
+MIN_ROWS = 10000
+
+#: How many ranges of element IDs every process gets, the processes that
+#: are done first take the remaining ones
+CHUNKS_PER_WORKER = 4
+
+_COMPARISONS = ('==', '!=', '<', '<=', '>', '>=')
+
+# The elements and element IDs the forked processes scan, only one scan
+# runs at a time
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def describe_query(cond):
+    """
+    Describe a query in a way that can be pickled.
+
+    :param cond: the query
+    :type cond: QueryImpl
+    :returns: the description or ``None`` if the query can't be described
+    """
+
+    try:
+        description = _describe(cond)
+        pickle.dumps(description, pickle.HIGHEST_PROTOCOL)
+    except (ValueError, TypeError, AttributeError, pickle.PicklingError):
+        return None
+
+    return description
+
+
+def _describe(cond):
+    hashval = getattr(cond, 'hashval', None)
+    if hashval is None:
+        raise ValueError('Not a query')
+
+    op = hashval[0]
+
+    if op in ('and', 'or') and cond.children:
+        return op, [_describe(child) for child in cond.children]
+
+    if op == 'not' and cond.children:
+        return op, _describe(cond.children[0])
+
+    if op in _COMPARISONS:
+        # Lists and dicts have been frozen to tuples for the hash value,
+        # comparing them to the stored lists would give other results
+        if not isinstance(hashval[2], _SCALAR_TYPES):
+            raise ValueError('Frozen value')
+        return hashval
+
+    if op in ('exists', 'matches', 'search'):
+        return hashval
+
+    if op in ('any', 'all'):
+        rhs = hashval[2]
+        if isinstance(rhs, QueryImpl):
+            return op, hashval[1], ('query', _describe(rhs))
+        if isinstance(rhs, tuple):
+            # Only used with ``in``, which works for tuples like for lists
+            return op, hashval[1], ('values', rhs)
+        raise ValueError('Unknown condition')
+
+    if op == 'test':
+        # Works for functions that can be imported by the other processes
+        return hashval
+
+    raise ValueError('Unknown operation {0!r}'.format(op))
+
+
+def build_query(description):
+    """
+    Build the query from its description, see :func:`describe_query`.
+
+    :rtype: QueryImpl
+    """
+
+    op = description[0]
+
+    if op in ('and', 'or'):
+        parts = [build_query(part) for part in description[1]]
+        cond = parts[0]
+        for part in parts[1:]:
+            cond = cond & part if op == 'and' else cond | part
+        return cond
+
+    if op == 'not':
+        return ~build_query(description[1])
+
+    field = Query(list(description[1]))
+
+    if op == '==':
+        return field == description[2]
+    if op == '!=':
+        return field != description[2]
+    if op == '<':
+        return field < description[2]
+    if op == '<=':
+        return field <= description[2]
+    if op == '>':
+        return field > description[2]
+    if op == '>=':
+        return field >= description[2]
+    if op == 'exists':
+        return field.exists()
+    if op in ('matches', 'search'):
+        return getattr(field, op)(description[2])
+    if op in ('any', 'all'):
+        kind, cond = description[2]
+        if kind == 'query':
+            cond = build_query(cond)
+        return getattr(field, op)(cond)
+    if op == 'test':
+        return field.test(description[2], *description[3])
+
+    raise ValueError('Unknown operation {0!r}'.format(op))
+
+
+def _fork_context():
+    if not hasattr(os, 'fork'):
+        return None
+
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:  # Python 2 always forks
+        return multiprocessing
+    except ValueError:
+        return None
+
+
+def _reset_locks():
+    """
+    Replace the module locks in the forked process (the pool's
+    initializer).
+
+    Forking copies the locks as they are, one that another thread of the
+    parent held at that moment would never be released in the child.
+    """
+
+    compiler._cache_lock = threading.Lock()
+    indexes._literals_lock = threading.Lock()
+    utils._regex_lock = threading.Lock()
+
+
+def _scan_range(task):
+    """
+    Find the matching elements of a range of element IDs (runs in the
+    forked process).
+    """
+
+    description, start, stop = task
+    data, eids = _shared
+    test = compile_query(build_query(description))
+
+    matching = []
+    for eid in eids[start:stop]:
+        element = data.get(eid)
+        if element is not None and test(element):
+            matching.append(eid)
+
+    return matching
+
+
+def scan(data, eids, description, workers):
+    """
+    Find the elements matching a query in a pool of processes.
+
+    :param data: the elements, keyed by their IDs
+    :param eids: the sorted IDs of the elements to test
+    :param description: the query's description, see :func:`describe_query`
+    :param workers: the number of processes
+    :returns: the sorted IDs of the matching elements or ``None`` if
+              processes can't be forked on this platform
+    :rtype: list | None
+    """
+
+    global _shared
+
+    context = _fork_context()
+    if context is None:
+        return None
+
+    size = -(-len(eids) // (workers * CHUNKS_PER_WORKER)) or 1
+    tasks = [(description, start, start + size)
+             for start in range(0, len(eids), size)]
+
+    with _shared_lock:
+        _shared = (data, eids)
+        try:
+            pool = context.Pool(workers, _reset_locks)
+            try:
+                # The results keep the order of the ranges
+                parts = pool.map(_scan_range, tasks)
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            _shared = None
+
+    return [eid for part in parts for eid in part]
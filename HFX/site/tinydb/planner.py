@@ -0,0 +1,298 @@
+"""
+Contains the query planner.
+
+The planner splits a query into the parts combined with ``&`` and ``|`` (see
+:attr:`QueryImpl.children <tinydb.queries.QueryImpl>`) and decides which parts
+a table's indexes can answer. The candidates of the index lookups are
+intersected for ``&`` and united for ``|``. Only the parts no index answers
+exactly are left to be tested on the candidates, using their compiled form
+(see :mod:`tinydb.compiler`):
+
+>>> table.create_index('type')
+>>> print(table.explain((where('type') == 'application') & (where('x') > 1)))
+Filter 1 test(s) on candidates
+  IndexLookup HashIndex('type',) == 'application' (~40 of 500 rows)
+"""
+
+from tinydb.compiler import compile_query
+
+
+class Plan(object):
+    """
+    The base class of the nodes producing candidates.
+    """
+
+    #: The estimated number of candidates
+    estimate = 0
+
+    #: Whether all candidates match the planned query
+    exact = False
+
+    def candidates(self):
+        """
+        Look up the candidates.
+
+        :returns: a set of element IDs
+        :rtype: set
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def describe(self, size):
+        """
+        Describe the node and its children.
+
+        :param size: the number of elements in the table
+        :returns: a list of lines
+        """
+        raise NotImplementedError('To be overridden!')
+
+
+class IndexLookup(Plan):
+    """
+    Look up the candidates for queries on a single field in an index.
+    """
+
+    def __init__(self, index, hashvals):
+        self.index = index
+        self.hashvals = hashvals
+        self.estimate = index.estimate(hashvals)
+        self.exact = index.is_exact(hashvals)
+
+    def candidates(self):
+        return self.index.lookup_all(self.hashvals)
+
+    def describe(self, size):
+        tests = ' and '.join('{0} {1!r}'.format(hashval[0], hashval[-1])
+                             for hashval in self.hashvals)
+
+        return ['IndexLookup {0}{1} {2} (~{3} of {4} rows)'.format(
+            type(self.index).__name__, self.index.path, tests,
+            self.estimate, size
+        )]
+
+
+class Intersect(Plan):
+    """
+    Intersect the candidates of several nodes (``&``).
+    """
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.estimate)
+        self.estimate = self.children[0].estimate
+        self.exact = all(child.exact for child in children)
+
+    def candidates(self):
+        # Start with the smallest set, intersecting only iterates over it
+        result = self.children[0].candidates()
+
+        for child in self.children[1:]:
+            if not result:
+                break
+            result &= child.candidates()
+
+        return result
+
+    def describe(self, size):
+        lines = ['Intersect (~{0} of {1} rows)'.format(self.estimate, size)]
+        for child in self.children:
+            lines.extend('  ' + line for line in child.describe(size))
+
+        return lines
+
+
+class Union(Plan):
+    """
+    Unite the candidates of several nodes (``|``).
+    """
+
+    def __init__(self, children):
+        self.children = children
+        self.estimate = sum(child.estimate for child in children)
+        self.exact = all(child.exact for child in children)
+
+    def candidates(self):
+        result = set()
+        for child in self.children:
+            result |= child.candidates()
+
+        return result
+
+    def describe(self, size):
+        lines = ['Union (~{0} of {1} rows)'.format(min(self.estimate, size),
+                                                  size)]
+        for child in self.children:
+            lines.extend('  ' + line for line in child.describe(size))
+
+        return lines
+
+
+class _Inexact(Plan):
+    """
+    Marks the candidates of a node as a superset of the matching elements.
+    """
+
+    def __init__(self, child):
+        self.child = child
+        self.estimate = child.estimate
+
+    def candidates(self):
+        return self.child.candidates()
+
+    def describe(self, size):
+        return self.child.describe(size)
+
+
+class QueryPlan(object):
+    """
+    The plan for running a query on a table.
+
+    :attr:`source` is the :class:`Plan` producing the candidates or ``None``
+    if every element has to be tested. :attr:`filters` are the queries the
+    candidates still have to match.
+    """
+
+    def __init__(self, cond, source, filters, size):
+        self.cond = cond
+        self.source = source
+        self.filters = filters
+        self.size = size
+
+    def matching(self, data):
+        """
+        Iterate over the IDs of all elements in ``data`` matching the query.
+        """
+
+        if self.source is None:
+            eids = list(data)
+            filters = [compile_query(self.cond)]
+        else:
+            eids = sorted(self.source.candidates())
+            filters = [compile_query(test) for test in self.filters]
+
+        if len(filters) == 1:
+            test = filters[0]
+        else:
+            def test(element):
+                return all(part(element) for part in filters)
+
+        for eid in eids:
+            # The caller may remove elements while iterating
+            element = data.get(eid)
+            if element is not None and test(element):
+                yield eid
+
+    def __str__(self):
+        if self.source is None:
+            return 'Scan {0} rows'.format(self.size)
+
+        lines = self.source.describe(self.size)
+        if self.filters:
+            lines = ['Filter {0} test(s) on candidates'.format(
+                len(self.filters))] + ['  ' + line for line in lines]
+
+        return '\n'.join(lines)
+
+
+def _flatten(cond, op):
+    """
+    Split a query into the parts combined with ``op`` (``and``/``or``).
+    """
+
+    if cond.hashval[0] == op and cond.children:
+        for child in cond.children:
+            for part in _flatten(child, op):
+                yield part
+    else:
+        yield cond
+
+
+def plan_query(cond, indexes, size):
+    """
+    Create the plan for running a query.
+
+    :param cond: the query
+    :param indexes: the table's indexes
+    :param size: the number of elements in the table
+    :rtype: QueryPlan
+    """
+
+    if not indexes or getattr(cond, 'hashval', None) is None:
+        return QueryPlan(cond, None, [cond], size)
+
+    source, filters = _plan(cond, indexes)
+    return QueryPlan(cond, source, filters, size)
+
+
+def _plan(cond, indexes):
+    """
+    :returns: the :class:`Plan` producing the candidates (or ``None``) and
+              the queries the candidates still have to match
+    """
+
+    op = cond.hashval[0]
+
+    if op == 'and' and cond.children:
+        return _plan_and(cond, indexes)
+
+    if op == 'or' and cond.children:
+        children = []
+        for part in _flatten(cond, 'or'):
+            child, filters = _plan(part, indexes)
+            if child is None:
+                # One part needs a full scan, so the whole query does
+                return None, [cond]
+
+            # The candidates must match the whole query, not just this part
+            children.append(child if not filters else _Inexact(child))
+
+        node = Union(children)
+        return node, [] if node.exact else [cond]
+
+    if op in ('and', 'or', 'not'):
+        return None, [cond]
+
+    return _plan_and(cond, indexes)
+
+
+def _plan_and(cond, indexes):
+    parts = list(_flatten(cond, 'and'))
+
+    leaves = {}
+    for part in parts:
+        if part.hashval[0] not in ('and', 'or', 'not'):
+            leaves.setdefault(part.hashval[1], []).append(part)
+
+    children = []
+    answered = set()
+
+    for index in indexes:
+        supported = [part for part in leaves.get(index.path, ())
+                     if index.supports(part.hashval)]
+        if not supported:
+            continue
+
+        child = IndexLookup(index, [part.hashval for part in supported])
+        children.append(child)
+
+        if child.exact:
+            answered.update(id(part) for part in supported)
+
+    filters = []
+    for part in parts:
+        if id(part) in answered:
+            continue
+
+        if part.hashval[0] == 'or':
+            child, part_filters = _plan(part, indexes)
+            if child is not None:
+                children.append(child)
+                filters.extend(part_filters)
+                continue
+
+        filters.append(part)
+
+    if not children:
+        return None, [cond]
+
+    node = children[0] if len(children) == 1 else Intersect(children)
+    return node, filters
@@ -16,10 +16,9 @@ True
 False
 """
 
-import re
 import sys
 
-from tinydb.utils import catch_warning, freeze
+from tinydb.utils import catch_warning, compile_regex, freeze
 
 __all__ = ('Query', 'where')
 
@@ -37,10 +36,13 @@ class QueryImpl(object):
 
     Queries can be combined with logical and/or and modified with logical not.
     """
-    def __init__(self, test, hashval):
+    def __init__(self, test, hashval, children=()):
         self.test = test
         self.hashval = hashval
 
+        #: The queries this query has been combined from
+        self.children = children
+
     def __call__(self, value):
         return self.test(value)
 
@@ -53,23 +55,48 @@ class QueryImpl(object):
     def __eq__(self, other):
         return self.hashval == other.hashval
 
+    def paths(self):
+        """
+        Get the paths of all fields the query reads.
+
+        >>> ((where('a') == 1) | (where('b').c > 2)).paths()
+        {('a',), ('b', 'c')}
+
+        :rtype: set[tuple]
+        """
+        return _hashval_paths(self.hashval)
+
     # --- Query modifiers -----------------------------------------------------
 
     def __and__(self, other):
         # We use a frozenset for the hash as the AND operation is commutative
         # (a | b == b | a)
         return QueryImpl(lambda value: self(value) and other(value),
-                         ('and', frozenset([self.hashval, other.hashval])))
+                         ('and', frozenset([self.hashval, other.hashval])),
+                         (self, other))
 
     def __or__(self, other):
         # We use a frozenset for the hash as the OR operation is commutative
         # (a & b == b & a)
         return QueryImpl(lambda value: self(value) or other(value),
-                         ('or', frozenset([self.hashval, other.hashval])))
+                         ('or', frozenset([self.hashval, other.hashval])),
+                         (self, other))
 
     def __invert__(self):
         return QueryImpl(lambda value: not self(value),
-                         ('not', self.hashval))
+                         ('not', self.hashval), (self,))
+
+
+def _hashval_paths(hashval):
+    op = hashval[0]
+
+    if op in ('and', 'or'):
+        return set().union(*[_hashval_paths(part) for part in hashval[1]])
+    if op == 'not':
+        return _hashval_paths(hashval[1])
+
+    # Every test only reads the value at its path
+    return set([hashval[1]])
 
 
 class Query(object):
@@ -240,7 +267,8 @@ class Query(object):
 
         :param regex: The regular expression to use for matching
         """
-        return self._generate_test(lambda value: re.match(regex, value),
+        pattern = compile_regex(regex)
+        return self._generate_test(lambda value: pattern.match(value),
                                    ('matches', tuple(self.path), regex))
 
     def search(self, regex):
@@ -252,7 +280,8 @@ class Query(object):
 
         :param regex: The regular expression to use for matching
         """
-        return self._generate_test(lambda value: re.search(regex, value),
+        pattern = compile_regex(regex)
+        return self._generate_test(lambda value: pattern.search(value),
                                    ('search', tuple(self.path), regex))
 
     def test(self, func, *args):
@@ -4,9 +4,15 @@ implementations.
 """
 
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+import mmap
 import os
+import re
+import struct
+import threading
 
-from tinydb.utils import with_metaclass
+from tinydb.utils import (MISSING, Mapping, with_metaclass, iteritems,
+                          itervalues)
 
 
 try:
@@ -14,12 +20,102 @@ try:
 except ImportError:
     import json
 
+try:
+    from urllib.parse import quote, unquote
+except ImportError:  # Python 2
+    from urllib import quote, unquote
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 
 def touch(fname, times=None):
     with open(fname, 'a'):
         os.utime(fname, times)
 
 
+def _encode_mapping(value):
+    """
+    Serialize the mappings that aren't dicts (like the rows of compact
+    tables, see :class:`~tinydb.database.CompactElement`).
+    """
+    if isinstance(value, Mapping):
+        return dict(value)
+
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def _json_options(kwargs):
+    """
+    Get the options to pass to ``json.dumps``.
+
+    Adds the hook serializing all mappings, ujson only takes it since
+    version 5.1 and uses the ``toDict`` method of compact elements instead.
+    """
+    if json.__name__ == 'json':
+        kwargs.setdefault('default', _encode_mapping)
+
+    return kwargs
+
+
+def merge_tables(data, tables):
+    """
+    Apply the table changes given to :meth:`Storage.write_tables` to the
+    state of a whole database.
+
+    :returns: the changed database
+    """
+    data = data or {}
+
+    for name, entry in iteritems(tables):
+        if entry is None:
+            data.pop(name, None)
+        else:
+            data[name] = entry[0]
+
+    return data
+
+
+def _serialize_record(parts):
+    """
+    Join the serialized parts of a journal record to a JSON list.
+    """
+    return '[' + ', '.join(parts) + ']'
+
+
+def convert(src, dst):
+    """
+    Copy all tables from one storage to another, e.g. to convert a database
+    to another format:
+
+    >>> convert(JSONStorage('stats.db'), BinaryStorage('stats.tdb'))
+
+    :param src: the storage to read
+    :type src: Storage
+    :param dst: the storage to write
+    :type dst: Storage
+    """
+
+    dst.write(src.read() or {})
+
+
+def replace(src, dst):
+    """
+    Move ``src`` to ``dst``, overwriting ``dst`` if it exists.
+
+    The move is atomic on POSIX systems.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
 class Storage(with_metaclass(ABCMeta, object)):
     """
     The abstract base class for all Storages.
@@ -57,6 +153,127 @@ class Storage(with_metaclass(ABCMeta, object)):
 
         raise NotImplementedError('To be overridden!')
 
+    def table_names(self):
+        """
+        Get the names of all stored tables.
+
+        The default implementation reads the whole database. Storages that
+        know their tables without reading them should override this.
+
+        :rtype: set[str]
+        """
+
+        return set(self.read() or {})
+
+    def table_info(self, name):
+        """
+        Get the metadata of a table without reading it.
+
+        Storages that keep metadata about their tables should override this,
+        the default implementation returns ``None`` to make the table read
+        its elements instead.
+
+        :param name: The name of the table.
+        :type name: str
+        :returns: a dict with the number of elements (``count``) and the
+                  highest element ID (``last_id``), both ``0`` if the table
+                  doesn't exist, or ``None`` if unknown
+        :rtype: dict
+        """
+
+        return None
+
+    def read_table(self, name):
+        """
+        Read the last stored state of a single table.
+
+        The default implementation reads the whole database. Storages that
+        can access tables separately should override this.
+        Return ``None`` here to indicate that the table doesn't exist.
+
+        :param name: The name of the table.
+        :type name: str
+        :rtype: dict
+        """
+
+        return (self.read() or {}).get(name)
+
+    def write_table(self, name, values, eids=None):
+        """
+        Write the current state of a single table.
+
+        The default implementation rewrites the whole database. Storages that
+        can persist partial changes should override this.
+
+        :param name: The name of the table.
+        :type name: str
+        :param values: The current state of the table.
+        :type values: dict
+        :param eids: The IDs of the elements that changed since the last
+                     write or ``None`` if the whole table may have changed.
+        :type eids: list
+        """
+
+        data = self.read() or {}
+        data[name] = values
+        self.write(data)
+
+    def purge_table(self, name):
+        """
+        Remove a single table from the storage.
+
+        :param name: The name of the table.
+        :type name: str
+        """
+
+        data = self.read() or {}
+        if name in data:
+            del data[name]
+            self.write(data)
+
+    def write_tables(self, tables):
+        """
+        Write the changes of several tables at once.
+
+        Used to commit transactions (see
+        :meth:`TinyDB.transaction <tinydb.database.TinyDB.transaction>`).
+        Storages should make sure either all or none of the changes are
+        stored.
+
+        :param tables: Maps table names to a tuple of the table's current
+                       state and the IDs of the changed elements (see
+                       :meth:`write_table`) or to ``None`` for tables to
+                       remove.
+        :type tables: dict
+        """
+
+        self.write(merge_tables(self.read(), tables))
+
+    def version(self):
+        """
+        Get a token that changes whenever another process changes the
+        stored data.
+
+        Tables compare it to the token their decoded elements were read with
+        and read them again if it differs. Storages that are only changed
+        through this instance return ``None`` (the default).
+        """
+
+        return None
+
+    @contextmanager
+    def lock(self):
+        """
+        Keep other processes from changing the storage.
+
+        Tables hold the lock while they read, change and write their
+        elements, so the changes of another process aren't overwritten.
+        Storages shared between processes should override this, the default
+        implementation does nothing.
+        """
+
+        yield
+
     def close(self):
         """
         Optional: Close open file handles, etc.
@@ -65,9 +282,111 @@ class Storage(with_metaclass(ABCMeta, object)):
         pass
 
 
+class _FileLock(object):
+    """
+    An advisory lock shared by all processes using the same lock file.
+
+    The lock is held by the whole process, nested acquisitions are counted
+    and other threads wait until the outermost one is released. Processes
+    not using the lock aren't kept from changing the data.
+
+    The lock file also holds a generation number which writers increment
+    (see :meth:`bump`), so changes are noticed even if the file system's
+    modification times are too coarse to tell them apart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT)
+
+        #: Held by the thread holding the lock, can be held alone to keep
+        #: the other threads out without locking the file
+        self.mutex = threading.RLock()
+        self._depth = 0
+        self._exclusive = False
+
+    def _lock(self, shared):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            return
+
+        # Windows only has exclusive locks. LK_LOCK gives up after 10
+        # seconds, so keep trying
+        os.lseek(self._fd, 0, 0)
+        while True:
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                return
+            except (IOError, OSError):
+                pass
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, 0)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    @contextmanager
+    def __call__(self, shared=False):
+        """
+        Hold the lock, shared with other readers if ``shared`` is set.
+
+        Asking for the exclusive lock while holding the shared one upgrades
+        it until the outermost acquisition is released.
+        """
+
+        with self.mutex:
+            if not self._depth or not (shared or self._exclusive):
+                self._lock(shared)
+                self._exclusive = not shared
+            self._depth += 1
+
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    self._unlock()
+                    self._exclusive = False
+
+    def generation(self):
+        """
+        Get the generation number.
+        """
+
+        os.lseek(self._fd, 0, 0)
+        data = os.read(self._fd, 8)
+
+        return struct.unpack('<Q', data)[0] if len(data) == 8 else 0
+
+    def bump(self):
+        """
+        Increment the generation number, the exclusive lock has to be held.
+
+        :returns: the new generation number
+        """
+
+        generation = self.generation() + 1
+        os.lseek(self._fd, 0, 0)
+        os.write(self._fd, struct.pack('<Q', generation))
+
+        return generation
+
+    def close(self):
+        os.close(self._fd)
+
+
 class JSONStorage(Storage):
     """
     Store the data in a JSON file.
+
+    Several processes can share the file. Writers hold an advisory lock on
+    ``<path>.lock`` (see :class:`_FileLock`) and merge their tables with
+    the ones the other processes have stored meanwhile. The decoded data is
+    kept until the file changes, which is checked by its size, modification
+    time and the lock file's generation number.
     """
 
     def __init__(self, path, **kwargs):
@@ -82,13 +401,84 @@ class JSONStorage(Storage):
 
         super(JSONStorage, self).__init__()
         touch(path)  # Create file if not exists
-        self.kwargs = kwargs
-        self._handle = open(path, 'r+')
+        self.kwargs = _json_options(kwargs)
+        self._path = path
+        self._lock = _FileLock(path + '.lock')
+
+        # The decoded data, the state of the file it belongs to and how often
+        # other processes have changed the file
+        self._data = MISSING
+        self._external_changes = 0
+
+        # Another process may replace the file until the lock is held
+        with self._lock(shared=True):
+            self._handle = open(path, 'r+')
+            self._stamp = self._current_stamp()
 
     def close(self):
         self._handle.close()
+        self._lock.close()
+
+    def _current_stamp(self):
+        stat = os.stat(self._path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime,
+                self._lock.generation())
+
+    def _check(self):
+        """
+        Drop the decoded data if another process has changed the file.
+
+        The lock has to be held.
+        """
+
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+
+        if stamp[0] != self._stamp[0]:
+            # The file has been replaced
+            self._handle.close()
+            self._handle = open(self._path, 'r+')
+
+        self._stamp = stamp
+        self._data = MISSING
+        self._external_changes += 1
+
+    def _committed(self):
+        """
+        Let the other processes know the file has been written.
+
+        The exclusive lock has to be held.
+        """
+
+        self._lock.bump()
+        self._stamp = self._current_stamp()
+
+    def version(self):
+        # Checked without locking the file, a writer caught in the middle
+        # only makes the next check notice another change. If another thread
+        # uses the file, it checks for changes itself.
+        if self._lock.mutex.acquire(False):
+            try:
+                self._check()
+            finally:
+                self._lock.mutex.release()
+
+        return self._external_changes
+
+    def lock(self):
+        return self._lock()
 
     def read(self):
+        with self._lock(shared=True):
+            self._check()
+
+            if self._data is MISSING:
+                self._data = self._load()
+
+            return self._data
+
+    def _load(self):
         # Get the file size
         self._handle.seek(0, 2)
         size = self._handle.tell()
@@ -101,28 +491,1403 @@ class JSONStorage(Storage):
             return json.load(self._handle)
 
     def write(self, data):
-        self._handle.seek(0)
-        serialized = json.dumps(data, **self.kwargs)
-        self._handle.write(serialized)
-        self._handle.flush()
-        self._handle.truncate()
+        with self._lock():
+            # The callers may have changed the decoded data
+            self._data = MISSING
+            self._check()
 
+            self._handle.seek(0)
+            serialized = json.dumps(data, **self.kwargs)
+            self._handle.write(serialized)
+            self._handle.flush()
+            self._handle.truncate()
 
-class MemoryStorage(Storage):
+            self._committed()
+
+    def write_table(self, name, values, eids=None):
+        # Read and write under the same lock to keep the other tables
+        with self._lock():
+            super(JSONStorage, self).write_table(name, values, eids)
+
+    def purge_table(self, name):
+        with self._lock():
+            super(JSONStorage, self).purge_table(name)
+
+    def write_tables(self, tables):
+        # Write to a temporary file and move it over the database, so a crash
+        # leaves either the old or the new state
+        with self._lock():
+            data = dict(self.read() or {})
+            serialized = json.dumps(merge_tables(data, tables), **self.kwargs)
+
+            self._replace_file([serialized])
+
+    def _replace_file(self, chunks):
+        """
+        Write ``chunks`` to a temporary file and move it over the database.
+
+        The exclusive lock has to be held.
+        """
+
+        self._move_tmp(self._write_tmp(chunks))
+
+    def _write_tmp(self, chunks):
+        """
+        Write ``chunks`` to a temporary file next to the database.
+
+        :returns: the temporary file's path
+        """
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                handle.write(chunk)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        return tmp_path
+
+    def _move_tmp(self, tmp_path):
+        """
+        Move the temporary file over the database.
+
+        The exclusive lock has to be held and no other handle of the database
+        may be open (Windows can't replace open files).
+        """
+
+        self._data = MISSING
+
+        self._handle.close()
+        replace(tmp_path, self._path)
+        self._handle = open(self._path, 'r+')
+
+        self._committed()
+
+
+_STRING = br'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+# Everything up to the next bracket outside of a string
+_BRACKET = re.compile(br'[^"{}\[\]]*(?:' + _STRING + br'[^"{}\[\]]*)*([{}\[\]])')
+_PAIRS = re.compile(br'\{\}|\[\]')
+_NOT_SYNTAX = bytes(bytearray(char for char in range(256)
+                              if char not in bytearray(b'"{}[]')))
+_SCALAR = re.compile(_STRING + br'|[^",}\s][^,}\s]*')
+_KEY = re.compile(br'\s*(' + _STRING + br')\s*:\s*')
+_OPEN = re.compile(br'\s*\{\s*')
+_SEPARATOR = re.compile(br'\s*([,}])\s*')
+
+
+def _escaped(data, start, pos):
     """
-    Store the data as JSON in memory.
+    Check whether the character at ``pos`` is escaped by backslashes.
     """
+    count = 0
+    while pos - count > start and data[pos - count - 1:pos - count] == b'\\':
+        count += 1
 
-    def __init__(self):
+    return count % 2 == 1
+
+
+def _unmatched_brackets(data, start, end):
+    """
+    Find the brackets in ``data[start:end]`` outside of strings that have no
+    counterpart in the range.
+
+    ``start`` mustn't be inside a string. If ``end`` is, the range is
+    shortened to end before the string.
+
+    :returns: the (new) end and the unmatched closing brackets followed by
+              the unmatched opening brackets
+    """
+
+    # Drop the escapes that matter (all others only leave a backslash) and
+    # everything but quotes and brackets
+    syntax = data[start:end].replace(b'\\\\', b'').replace(b'\\"', b'')
+    syntax = syntax.translate(None, _NOT_SYNTAX)
+
+    if syntax.count(b'"') % 2:
+        # Cut off the unterminated string
+        syntax = syntax[:syntax.rindex(b'"')]
+
+        end = data.rindex(b'"', start, end)
+        while _escaped(data, start, end):
+            end = data.rindex(b'"', start, end)
+
+    # Every other part is inside a string
+    brackets = b''.join(syntax.split(b'"')[::2])
+    count = 1
+    while count:
+        brackets, count = _PAIRS.subn(b'', brackets)
+
+    return end, brackets
+
+
+class _TableScanner(object):
+    """
+    Finds the tables in a JSON file without decoding them.
+
+    Tables are skipped a block at a time, counting the brackets outside of
+    strings in each block using only (fast) string methods. Only the block
+    in which a table ends is searched bracket by bracket.
+    """
+
+    #: How many bytes to skip at once
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, handle, chunk_size):
+        self._handle = handle
+        self._chunk_size = chunk_size
+        self._buffer = b''
+        self._offset = 0  # The position of the buffer in the file
+        self._pos = 0  # The position in the buffer
+
+    def _fill(self):
+        chunk = self._handle.read(self._chunk_size)
+
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+
+        return bool(chunk)
+
+    def _match(self, regex):
+        while True:
+            match = regex.match(self._buffer, self._pos)
+
+            # A match reaching the end of the buffer might continue in the
+            # next chunk
+            if match is not None and match.end() < len(self._buffer):
+                break
+            if not self._fill():
+                match = regex.match(self._buffer, self._pos)
+                break
+
+        if match is not None:
+            self._pos = match.end()
+
+        return match
+
+    def _expect(self, regex):
+        match = self._match(regex)
+        if match is None:
+            raise ValueError('Invalid JSON at offset {0}'.format(
+                self._offset + self._pos))
+
+        return match
+
+    def _peek(self):
+        if self._pos >= len(self._buffer):
+            self._fill()
+
+        return self._buffer[self._pos:self._pos + 1]
+
+    def _skip_value(self):
+        if self._peek() not in (b'{', b'['):
+            self._expect(_SCALAR)
+            return
+
+        self._pos += 1
+        depth = 1
+        size = self.BLOCK_SIZE
+
+        # Skip whole blocks as long as the value doesn't end in them
+        while True:
+            while len(self._buffer) - self._pos < size and self._fill():
+                pass
+
+            start = self._pos
+            end = min(start + size, len(self._buffer))
+            if start == end:
+                raise ValueError('Unexpected end of JSON')
+
+            end, brackets = _unmatched_brackets(self._buffer, start, end)
+            if end == start:
+                # A single string fills the whole block
+                if len(self._buffer) - start < size:
+                    raise ValueError('Unterminated string')
+                size *= 2
+                continue
+
+            closing = len(brackets) - len(brackets.lstrip(b'}]'))
+            if closing >= depth:
+                break
+
+            depth += len(brackets) - 2 * closing
+            self._pos = end
+
+        # Find the end bracket by bracket
+        while True:
+            bracket = self._expect(_BRACKET).group(1)
+            depth += 1 if bracket in (b'{', b'[') else -1
+
+            if not depth:
+                return
+
+    def __iter__(self):
         """
-        Create a new instance.
+        Iterate over the names of the tables and the start and end offsets
+        of their values.
         """
 
-        super(MemoryStorage, self).__init__()
-        self.memory = None
+        self._expect(_OPEN)
+        if self._peek() == b'}':
+            return
 
-    def read(self):
-        return self.memory
+        while True:
+            key = self._expect(_KEY).group(1)
+            name = json.loads(key.decode('utf-8'))
 
-    def write(self, data):
-        self.memory = data
+            start = self._offset + self._pos
+            self._skip_value()
+            yield name, start, self._offset + self._pos
+
+            if self._expect(_SEPARATOR).group(1) == b'}':
+                return
+
+
+class StreamingJSONStorage(JSONStorage):
+    """
+    Store the data in a JSON file, reading only the tables that are used.
+
+    The file has the same format as the one of :class:`JSONStorage`. Instead
+    of decoding the whole file, the tables are located in it without decoding
+    them (see :class:`_TableScanner`) and only the requested table is
+    decoded. Writing a table copies the bytes of all other tables, so they
+    aren't decoded either.
+
+    The tables' locations are kept as long as the file doesn't change, so
+    getting another table only decodes that table. Reading the whole database
+    (e.g. for :meth:`TinyDB.tables <tinydb.database.TinyDB.tables>`) still
+    decodes the whole file.
+    """
+
+    #: How many bytes to read from the file at once
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path, **kwargs):
+        super(StreamingJSONStorage, self).__init__(path, **kwargs)
+
+        self._spans = []
+        self._spans_key = None
+
+    def _scan(self, handle):
+        """
+        Locate the tables in the file.
+
+        The result is kept until the file changes. The lock has to be held.
+
+        :returns: a list of the tables' names and the start and end offsets
+                  of their values
+        """
+
+        self._check()
+
+        if self._stamp != self._spans_key:
+            self._spans = list(_TableScanner(handle, self.CHUNK_SIZE)) \
+                if self._stamp[1] else []
+            self._spans_key = self._stamp
+
+        return self._spans
+
+    def table_names(self):
+        with self._lock(shared=True), open(self._path, 'rb') as handle:
+            return set(table for table, start, end in self._scan(handle))
+
+    def read_table(self, name):
+        with self._lock(shared=True), open(self._path, 'rb') as handle:
+            # Files written by json.dumps don't contain a table twice
+            for table, start, end in self._scan(handle):
+                if table == name:
+                    handle.seek(start)
+                    return json.loads(handle.read(end - start).decode('utf-8'))
+
+        return None
+
+    def write_table(self, name, values, eids=None):
+        self._splice({name: json.dumps(values, **self.kwargs)})
+
+    def purge_table(self, name):
+        self._splice({name: None})
+
+    def write_tables(self, tables):
+        self._splice(dict(
+            (name, None if entry is None else
+             json.dumps(entry[0], **self.kwargs))
+            for name, entry in iteritems(tables)
+        ))
+
+    def _splice(self, tables):
+        """
+        Replace the serialized ``tables`` (or remove the ones mapped to
+        ``None``), copying the bytes of all other tables.
+        """
+
+        for name, serialized in iteritems(tables):
+            if serialized is not None and not isinstance(serialized, bytes):
+                tables[name] = serialized.encode('utf-8')
+
+        with self._lock():
+            with open(self._path, 'rb') as handle:
+                spans = self._scan(handle)
+
+                if not self._changes(handle, spans, tables):
+                    return
+
+                tmp_path = self._write_tmp(
+                    self._splice_chunks(handle, spans, tables)
+                )
+
+            self._move_tmp(tmp_path)
+
+    @staticmethod
+    def _changes(handle, spans, tables):
+        """
+        Check whether writing ``tables`` changes the file.
+        """
+
+        stored = {}
+        for table, start, end in spans:
+            if table in tables:
+                stored[table] = start, end
+
+        for name, serialized in iteritems(tables):
+            if name not in stored:
+                if serialized is not None:
+                    return True
+                continue
+
+            start, end = stored[name]
+            if serialized is None or len(serialized) != end - start:
+                return True
+
+            handle.seek(start)
+            if handle.read(end - start) != serialized:
+                return True
+
+        return False
+
+    def _splice_chunks(self, handle, spans, tables):
+        separator = ''
+
+        yield '{'
+
+        for table, start, end in spans:
+            if table in tables:
+                continue
+
+            yield separator + json.dumps(table) + ': '
+            separator = ', '
+
+            handle.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = handle.read(min(remaining, self.CHUNK_SIZE))
+                remaining -= len(chunk)
+                yield chunk
+
+        for name, serialized in iteritems(tables):
+            if serialized is not None:
+                yield separator + json.dumps(name) + ': '
+                yield serialized
+                separator = ', '
+
+        yield '}'
+
+
+class MemoryStorage(Storage):
+    """
+    Store the data as JSON in memory.
+    """
+
+    def __init__(self):
+        """
+        Create a new instance.
+        """
+
+        super(MemoryStorage, self).__init__()
+        self.memory = None
+
+    def read(self):
+        return self.memory
+
+    def write(self, data):
+        self.memory = data
+
+
+class JournalStorage(Storage):
+    """
+    Store the data in a JSON file and log changes to a journal next to it.
+
+    Instead of rewriting the whole file on every change, each inserted,
+    updated or removed element is appended as a single line to
+    ``<path>.journal``. When opening the database the journal is replayed on
+    top of the JSON file. Once the journal grows larger than
+    :attr:`COMPACT_RATIO` times the JSON file, it is merged back into the JSON
+    file in a background thread.
+
+    The JSON file has the same format as the one of
+    :class:`~tinydb.storages.JSONStorage`, so existing databases can be opened
+    with this storage right away.
+    """
+
+    #: The journal size relative to the JSON file that triggers a compaction
+    COMPACT_RATIO = 1.0
+
+    #: The journal size (in bytes) below which no compaction happens
+    COMPACT_MIN_SIZE = 1024 * 1024
+
+    def __init__(self, path, compact_ratio=None, compact_min_size=None,
+                 **kwargs):
+        """
+        Create a new instance.
+
+        Also creates the storage file, if it doesn't exist.
+
+        :param path: Where to store the JSON data.
+        :type path: str
+        :param compact_ratio: Overrides :attr:`COMPACT_RATIO`.
+        :param compact_min_size: Overrides :attr:`COMPACT_MIN_SIZE`.
+        """
+
+        super(JournalStorage, self).__init__()
+        touch(path)  # Create file if not exists
+
+        # Every journal record has to fit on a single line
+        kwargs.pop('indent', None)
+        self.kwargs = _json_options(kwargs)
+
+        if compact_ratio is not None:
+            self.COMPACT_RATIO = compact_ratio
+        if compact_min_size is not None:
+            self.COMPACT_MIN_SIZE = compact_min_size
+
+        self._path = path
+        self._journal_path = path + '.journal'
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        self._epoch = 0
+
+        #: Maps table names to dicts of element IDs and serialized elements
+        self._tables = self._load()
+
+        # The tables whose dicts have been handed out by read_table, they're
+        # copied before they're changed
+        self._shared = set()
+
+        self._base_size = os.path.getsize(path)
+        self._journal = open(self._journal_path, 'ab')
+        self._journal_size = self._journal.tell()
+
+    def _dumps(self, value):
+        return json.dumps(value, **self.kwargs)
+
+    def _serialize_table(self, rows):
+        return '{' + ', '.join(self._dumps(key) + ': ' + row
+                               for key, row in iteritems(rows)) + '}'
+
+    def _load(self):
+        """
+        Read the JSON file and replay the journal on top of it.
+        """
+
+        with open(self._path) as handle:
+            content = handle.read()
+
+        tables = {}
+        for name, rows in iteritems(json.loads(content) if content else {}):
+            tables[name] = dict((key, self._dumps(row))
+                                for key, row in iteritems(rows))
+
+        if not os.path.exists(self._journal_path):
+            return tables
+
+        offset = 0
+        with open(self._journal_path, 'rb') as handle:
+            for line in handle:
+                # A line that hasn't been written completely marks the end of
+                # the journal
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+
+                self._replay(tables, record)
+                offset += len(line)
+
+        if offset != os.path.getsize(self._journal_path):
+            # Drop the incomplete tail so new records start on a fresh line
+            with open(self._journal_path, 'r+b') as handle:
+                handle.truncate(offset)
+
+        return tables
+
+    def _replay(self, tables, record):
+        # For batches, the second item is the list of records
+        op, name = record[0], record[1]
+
+        if op == 'set':
+            tables.setdefault(name, {})[record[2]] = self._dumps(record[3])
+        elif op == 'del':
+            tables.get(name, {}).pop(record[2], None)
+        elif op == 'table':
+            tables[name] = dict((key, self._dumps(row))
+                                for key, row in iteritems(record[2]))
+        elif op == 'drop':
+            tables.pop(name, None)
+        elif op == 'batch':
+            for part in name:
+                self._replay(tables, part)
+
+    def _append(self, records):
+        """
+        Append serialized records to the journal.
+        """
+
+        data = ''.join(_serialize_record(record) + '\n' for record in records)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self._journal.write(data)
+        self._journal.flush()
+        self._journal_size += len(data)
+
+        threshold = max(self.COMPACT_MIN_SIZE,
+                        self.COMPACT_RATIO * self._base_size)
+        if self._journal_size > threshold and not self._compacting():
+            self._start_compaction()
+
+    def _compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def _start_compaction(self):
+        # The serialized rows are immutable, copying the dicts is enough to
+        # get a consistent state for the background thread
+        tables = dict((name, dict(rows)) for name, rows in iteritems(self._tables))
+
+        self._compactor = threading.Thread(
+            target=self._compact,
+            args=(tables, self._journal_size, self._epoch)
+        )
+        self._compactor.daemon = True
+        self._compactor.start()
+
+    def _compact(self, tables, offset, epoch):
+        """
+        Merge the journal up to ``offset`` into the JSON file.
+
+        Replaying records that already are part of the JSON file is harmless,
+        so crashing between the two steps doesn't lose any data.
+        """
+
+        with self._compact_lock:
+            if epoch != self._epoch:
+                # The whole database has been rewritten in the meantime
+                return
+
+            size = self._write_file(tables)
+
+            with self._lock:
+                self._base_size = size
+                self._truncate_journal(offset)
+
+    def _write_file(self, tables):
+        """
+        Atomically write ``tables`` to the JSON file.
+
+        :returns: the size of the new file
+        """
+
+        data = '{' + ', '.join(self._dumps(name) + ': ' +
+                               self._serialize_table(rows)
+                               for name, rows in iteritems(tables)) + '}'
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        replace(tmp_path, self._path)
+
+        return len(data)
+
+    def _truncate_journal(self, offset):
+        """
+        Drop the first ``offset`` bytes from the journal.
+        """
+
+        self._journal.close()
+
+        with open(self._journal_path, 'rb') as handle:
+            handle.seek(offset)
+            tail = handle.read()
+
+        tmp_path = self._journal_path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            handle.write(tail)
+        replace(tmp_path, self._journal_path)
+
+        self._journal = open(self._journal_path, 'ab')
+        self._journal_size = len(tail)
+
+    def compact(self):
+        """
+        Merge the journal into the JSON file and wait until it's done.
+        """
+
+        with self._compact_lock:
+            with self._lock:
+                self._rewrite()
+
+    def _rewrite(self):
+        # Invalidate running compactions before replacing the JSON file
+        self._epoch += 1
+        self._base_size = self._write_file(self._tables)
+        self._truncate_journal(self._journal_size)
+
+    def read(self):
+        with self._lock:
+            if not self._tables:
+                return None
+
+            return dict((name, self._decode(rows))
+                        for name, rows in iteritems(self._tables))
+
+    def table_names(self):
+        with self._lock:
+            return set(self._tables)
+
+    def table_info(self, name):
+        with self._lock:
+            rows = self._tables.get(name, {})
+            return {'count': len(rows),
+                    'last_id': max([int(key) for key in rows] or [0])}
+
+    def read_table(self, name):
+        with self._lock:
+            rows = self._tables.get(name)
+            if rows is None:
+                return None
+
+            # Later writes copy the rows before changing them, so the table
+            # keeps the state it was read in
+            self._shared.add(name)
+            return SerializedTable(rows)
+
+    @staticmethod
+    def _decode(rows):
+        return dict((key, json.loads(row)) for key, row in iteritems(rows))
+
+    def write(self, data):
+        # Replacing the whole database is done by rewriting the JSON file
+        with self._compact_lock:
+            with self._lock:
+                self._tables = dict(
+                    (name, dict((str(eid), self._dumps(value))
+                                for eid, value in iteritems(values)))
+                    for name, values in iteritems(data)
+                )
+                self._shared.clear()
+                self._rewrite()
+
+    def _table_records(self, name, values, eids):
+        """
+        Apply the changes of a table to the in-memory state.
+
+        :returns: the journal records describing the changes
+        """
+
+        dumps = self._dumps
+        current = self._tables.get(name)
+
+        if eids is None or current is None:
+            rows = dict((str(eid), dumps(value))
+                        for eid, value in iteritems(values))
+            if rows == current:
+                return []
+
+            self._tables[name] = rows
+            return [('"table"', dumps(name), self._serialize_table(rows))]
+
+        if name in self._shared:
+            self._shared.discard(name)
+            current = self._tables[name] = dict(current)
+
+        records = []
+        for eid in eids:
+            key = str(eid)
+
+            if eid in values:
+                row = dumps(values[eid])
+                current[key] = row
+                records.append(('"set"', dumps(name), dumps(key), row))
+            else:
+                current.pop(key, None)
+                records.append(('"del"', dumps(name), dumps(key)))
+
+        return records
+
+    def _drop_records(self, name):
+        if self._tables.pop(name, None) is None:
+            return []
+
+        return [('"drop"', self._dumps(name))]
+
+    def write_table(self, name, values, eids=None):
+        with self._lock:
+            records = self._table_records(name, values, eids)
+            if records:
+                self._append(records)
+
+    def purge_table(self, name):
+        with self._lock:
+            records = self._drop_records(name)
+            if records:
+                self._append(records)
+
+    def write_tables(self, tables):
+        with self._lock:
+            records = []
+            for name, entry in iteritems(tables):
+                if entry is None:
+                    records.extend(self._drop_records(name))
+                else:
+                    records.extend(self._table_records(name, *entry))
+
+            # A single line is either replayed completely or not at all
+            if records:
+                self._append([('"batch"', '[' + ', '.join(
+                    _serialize_record(record) for record in records) + ']')])
+
+    def close(self):
+        with self._compact_lock:
+            with self._lock:
+                self._journal.close()
+
+
+class DirectoryStorage(Storage):
+    """
+    Store every table in its own JSON file in a directory.
+
+    Writing a table only rewrites that table's file, listing and removing
+    tables only looks at the directory. Every table has its own lock, so
+    threads writing different tables don't wait for each other.
+
+    The files are named after the (quoted) table names, e.g. ``Vars.json``.
+    Files are replaced atomically. Changes to several tables (see
+    :meth:`write_tables`) are listed in a commit file before moving the new
+    files in place, so an interrupted commit is completed when opening the
+    directory the next time.
+    """
+
+    #: The extension of the table files
+    EXTENSION = '.json'
+
+    #: The name of the file listing the steps of a running commit
+    COMMIT_FILE = 'commit.log'
+
+    #: The name of the file keeping the tables' metadata
+    META_FILE = 'tables.meta'
+
+    def __init__(self, path, **kwargs):
+        """
+        Create a new instance.
+
+        Also creates the directory, if it doesn't exist.
+
+        :param path: The directory to store the tables in.
+        :type path: str
+        """
+
+        super(DirectoryStorage, self).__init__()
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.kwargs = _json_options(kwargs)
+        self._path = path
+
+        self._lock = threading.Lock()
+        self._table_locks = {}
+        self._meta_lock = threading.Lock()
+
+        self._recover()
+
+    def _file(self, name):
+        if not isinstance(name, str):
+            name = name.encode('utf-8')
+
+        return os.path.join(self._path, quote(name, safe='') + self.EXTENSION)
+
+    def _table_lock(self, name):
+        with self._lock:
+            return self._table_locks.setdefault(name, threading.Lock())
+
+    def _recover(self):
+        """
+        Complete an interrupted commit.
+        """
+
+        commit_path = os.path.join(self._path, self.COMMIT_FILE)
+
+        if os.path.exists(commit_path):
+            try:
+                with open(commit_path) as handle:
+                    steps = json.load(handle)
+            except ValueError:
+                # The commit file itself is incomplete, nothing has been
+                # moved yet
+                steps = []
+
+            self._apply(steps)
+            os.remove(commit_path)
+
+    @staticmethod
+    def _apply(steps):
+        """
+        Move the new table files in place and remove the dropped ones.
+
+        Steps that already have been applied are skipped.
+        """
+
+        for src, dst in steps:
+            if src is not None:
+                if os.path.exists(src):
+                    replace(src, dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+
+    @staticmethod
+    def _file_version(path):
+        """
+        Get the size and modification time of a file (in microseconds) or
+        ``None`` if it doesn't exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return [stat.st_size, int(stat.st_mtime * 1000000)]
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self._path, self.META_FILE)) as handle:
+                return json.load(handle)
+        except (IOError, ValueError):
+            return {}
+
+    def _update_meta(self, tables):
+        """
+        Store the metadata of the written tables.
+
+        Each entry holds the element count, the highest ID and the version
+        (see :meth:`_file_version`) of the table's file. Entries that don't
+        match the file's version are ignored, so a table changed by someone
+        else or a crash before updating the metadata only costs reading the
+        table.
+
+        :param tables: maps table names to their values or ``None`` for
+                       removed tables
+        """
+
+        with self._meta_lock:
+            meta = self._read_meta()
+
+            for name, values in iteritems(tables):
+                version = self._file_version(self._file(name))
+                if values is None or version is None:
+                    meta.pop(name, None)
+                    continue
+
+                eids = [int(eid) for eid in values]
+                meta[name] = [len(eids), max(eids or [0])] + version
+
+            meta_path = os.path.join(self._path, self.META_FILE)
+            with open(meta_path + '.tmp', 'w') as handle:
+                json.dump(meta, handle)
+            replace(meta_path + '.tmp', meta_path)
+
+    def _write_tmp(self, name, values, sync=False):
+        """
+        Write a table to a temporary file next to its file.
+
+        :returns: the path of the temporary file
+        """
+
+        tmp_path = self._file(name) + '.tmp'
+        with open(tmp_path, 'w') as handle:
+            handle.write(json.dumps(values, **self.kwargs))
+            if sync:
+                handle.flush()
+                os.fsync(handle.fileno())
+
+        return tmp_path
+
+    def table_names(self):
+        names = set()
+
+        for filename in os.listdir(self._path):
+            if not filename.endswith(self.EXTENSION):
+                continue
+
+            name = unquote(filename[:-len(self.EXTENSION)])
+            if isinstance(name, bytes):  # Python 2
+                name = name.decode('utf-8')
+            names.add(name)
+
+        return names
+
+    def table_info(self, name):
+        version = self._file_version(self._file(name))
+        if version is None:
+            return {'count': 0, 'last_id': 0}
+
+        entry = self._read_meta().get(name)
+        if entry is None or entry[2:] != version:
+            return None
+
+        return {'count': entry[0], 'last_id': entry[1]}
+
+    def read(self):
+        tables = dict((name, self.read_table(name))
+                      for name in self.table_names())
+
+        # Skip tables removed while reading
+        tables = dict((name, values) for name, values in iteritems(tables)
+                      if values is not None)
+
+        return tables or None
+
+    def read_table(self, name):
+        try:
+            with open(self._file(name)) as handle:
+                return json.load(handle)
+        except IOError:
+            if os.path.exists(self._file(name)):
+                raise
+            return None
+
+    def write(self, data):
+        tables = dict((name, (values, None))
+                      for name, values in iteritems(data))
+
+        for name in self.table_names():
+            if name not in tables:
+                tables[name] = None
+
+        self.write_tables(tables)
+
+    def write_table(self, name, values, eids=None):
+        with self._table_lock(name):
+            replace(self._write_tmp(name, values), self._file(name))
+            self._update_meta({name: values})
+
+    def purge_table(self, name):
+        with self._table_lock(name):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+                self._update_meta({name: None})
+
+    def write_tables(self, tables):
+        # Always lock the tables in the same order to avoid deadlocks
+        locks = [self._table_lock(name) for name in sorted(tables)]
+        for lock in locks:
+            lock.acquire()
+
+        try:
+            steps = []
+            for name, entry in iteritems(tables):
+                if entry is None:
+                    steps.append((None, self._file(name)))
+                else:
+                    steps.append((self._write_tmp(name, entry[0], sync=True),
+                                  self._file(name)))
+
+            if len(steps) < 2:
+                self._apply(steps)
+            else:
+                commit_path = os.path.join(self._path, self.COMMIT_FILE)
+                with open(commit_path + '.tmp', 'w') as handle:
+                    json.dump(steps, handle)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                replace(commit_path + '.tmp', commit_path)
+
+                self._apply(steps)
+                os.remove(commit_path)
+
+            self._update_meta(dict(
+                (name, None if entry is None else entry[0])
+                for name, entry in iteritems(tables)
+            ))
+        finally:
+            for lock in locks:
+                lock.release()
+
+
+class LazyTable(Mapping):
+    """
+    A stored table decoding its elements on access.
+
+    Maps the IDs the table had when it was read (as ints) to the elements.
+    Storages can return these from :meth:`Storage.read_table`, tables then
+    only decode the elements they use (see
+    :class:`~tinydb.database.LazyElements`).
+    """
+
+    def __init__(self, eids):
+        self._eids = eids
+        self._eid_set = None
+
+    def _decode(self, eid):
+        """
+        Decode an element.
+        """
+        raise NotImplementedError('To be overridden!')
+
+    def __getitem__(self, eid):
+        if eid not in self:
+            raise KeyError(eid)
+
+        return self._decode(eid)
+
+    def __contains__(self, eid):
+        if self._eid_set is None:
+            self._eid_set = frozenset(self._eids)
+
+        return eid in self._eid_set
+
+    def __iter__(self):
+        return iter(self._eids)
+
+    def __len__(self):
+        return len(self._eids)
+
+
+class SerializedTable(LazyTable):
+    """
+    A table kept as serialized JSON elements, keyed by the IDs as strings.
+    """
+
+    def __init__(self, rows):
+        super(SerializedTable, self).__init__([int(key) for key in rows])
+        self._rows = rows
+
+    def _decode(self, eid):
+        return json.loads(self._rows[str(eid)])
+
+
+class BinaryTable(LazyTable):
+    """
+    A table of a :class:`BinaryStorage`.
+
+    The elements are read from the file the table has been read from, which
+    stays mapped while the table is used, so later writes don't change it.
+    Windows can't replace a mapped file, there the elements are read from
+    the storage's current file once it has been written.
+    """
+
+    def __init__(self, storage, name, entry):
+        super(BinaryTable, self).__init__(entry.eids())
+        self._storage = storage
+        self._name = name
+        self._entry = entry
+
+    def _decode(self, eid):
+        entry = self._entry
+        if entry.data is None:
+            entry = self._storage._tables[self._name]
+
+        return entry.decode(eid)
+
+
+class _TableEntry(object):
+    """
+    The directory entry of a table in a :class:`BinaryStorage` file.
+    """
+
+    def __init__(self, data, start, size, count, last_id, pos):
+        self.data = data
+        self.start = start
+        self.size = size
+        self.count = count
+        self.last_id = last_id
+        self.pos = pos  # The position of the element IDs in the directory
+
+        self._offsets = None
+
+    def eids(self):
+        return struct.unpack_from('<{0}q'.format(self.count), self.data,
+                                  self.pos)
+
+    def offsets(self):
+        """
+        Get the positions of the elements' records (relative to
+        :attr:`start`), keyed by the element IDs.
+        """
+
+        if self._offsets is None:
+            offsets = struct.unpack_from('<{0}Q'.format(self.count), self.data,
+                                         self.pos + 8 * self.count)
+            self._offsets = dict(zip(self.eids(), offsets))
+
+        return self._offsets
+
+    def directory(self):
+        """
+        Get the serialized element IDs and record positions.
+        """
+        return self.data[self.pos:self.pos + 16 * self.count]
+
+    def decode(self, eid):
+        """
+        Decode the record of an element.
+        """
+        pos = self.start + self.offsets()[eid]
+
+        length, = struct.unpack_from('<I', self.data, pos)
+        return json.loads(self.data[pos + 4:pos + 4 + length].decode('utf-8'))
+
+
+class BinaryStorage(Storage):
+    """
+    Store the data in a compact binary file, decoding elements on access.
+
+    The file is laid out as::
+
+        MAGIC
+        records     per table, the records of all elements: a uint32
+                    length followed by the compact JSON of the element
+        directory   per table: the name, the position and size of its
+                    records, the number of elements, the highest ID, the
+                    element IDs and the records' positions
+        footer      the position of the directory (uint64) and MAGIC
+
+    The file is memory-mapped. Reading a table only reads its directory,
+    elements are decoded when they are accessed (see :class:`BinaryTable`),
+    so a lookup by ID or through an index only decodes the matching
+    elements. Writing rewrites the file, the records of unchanged elements
+    are copied without decoding them.
+
+    Use :func:`convert` to convert an existing database.
+    """
+
+    MAGIC = b'TINYDB\x00\x01'
+
+    def __init__(self, path, **kwargs):
+        """
+        Create a new instance.
+
+        Also creates the storage file, if it doesn't exist.
+
+        :param path: Where to store the data.
+        :type path: str
+        """
+
+        super(BinaryStorage, self).__init__()
+        touch(path)  # Create file if not exists
+
+        # Every record is a single line of compact JSON
+        kwargs.pop('indent', None)
+        kwargs.setdefault('separators', (',', ':'))
+        self.kwargs = _json_options(kwargs)
+
+        self._path = path
+        self._open()
+
+    def _open(self):
+        self._handle = open(self._path, 'rb')
+        self._data = None
+        self._tables = {}
+
+        size = os.fstat(self._handle.fileno()).st_size
+        if not size:
+            return
+
+        data = self._data = mmap.mmap(self._handle.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        magic = self.MAGIC
+
+        if size < 2 * len(magic) + 8 or data[:len(magic)] != magic or \
+                data[size - len(magic):] != magic:
+            raise ValueError('{0} is not a binary database'.format(self._path))
+
+        end = size - len(magic) - 8
+        pos, = struct.unpack_from('<Q', data, end)
+
+        while pos < end:
+            length, = struct.unpack_from('<I', data, pos)
+            name = data[pos + 4:pos + 4 + length].decode('utf-8')
+            pos += 4 + length
+
+            start, size, count, last_id = struct.unpack_from('<QQIq', data,
+                                                             pos)
+            pos += 28
+
+            self._tables[name] = _TableEntry(data, start, size, count,
+                                             last_id, pos)
+            pos += 16 * count
+
+    def close(self):
+        self._close_map()
+        self._handle.close()
+
+    def _close_map(self):
+        """
+        Unmap the file, the tables read from it can't use it anymore.
+        """
+
+        if self._data is None:
+            return
+
+        for entry in itervalues(self._tables):
+            entry.data = None
+        self._data.close()
+
+    def table_names(self):
+        return set(self._tables)
+
+    def table_info(self, name):
+        entry = self._tables.get(name)
+        if entry is None:
+            return {'count': 0, 'last_id': 0}
+
+        return {'count': entry.count, 'last_id': entry.last_id}
+
+    def read(self):
+        if not self._tables:
+            return None
+
+        return dict((name, dict(self.read_table(name)))
+                    for name in self._tables)
+
+    def read_table(self, name):
+        entry = self._tables.get(name)
+        if entry is None:
+            return None
+
+        return BinaryTable(self, name, entry)
+
+    def write(self, data):
+        tables = dict((name, None) for name in self._tables)
+        for name, values in iteritems(data):
+            tables[name] = values, None
+
+        self._rewrite(tables)
+
+    def write_table(self, name, values, eids=None):
+        entry = self._tables.get(name)
+
+        # TinyDB writes empty tables when opening them
+        if entry is not None and not entry.count and not values:
+            return
+
+        self._rewrite({name: (values, eids)})
+
+    def purge_table(self, name):
+        if name in self._tables:
+            self._rewrite({name: None})
+
+    def write_tables(self, tables):
+        self._rewrite(tables, sync=True)
+
+    def _rewrite(self, tables, sync=False):
+        """
+        Write a new file with the changes of ``tables`` (see
+        :meth:`Storage.write_tables`) and map it.
+        """
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as handle:
+            handle.write(self.MAGIC)
+            directory = []
+
+            for name, entry in iteritems(self._tables):
+                if name not in tables:
+                    # Copy the unchanged table as it is
+                    directory.append((name, handle.tell(), entry.size,
+                                      entry.count, entry.last_id,
+                                      entry.directory()))
+                    self._copy(handle, entry.start, entry.size)
+
+            for name, change in iteritems(tables):
+                if change is not None:
+                    directory.append(self._write_records(handle, name, *change))
+
+            pos = handle.tell()
+            for name, start, size, count, last_id, eids in directory:
+                name = name.encode('utf-8')
+                handle.write(struct.pack('<I', len(name)) + name)
+                handle.write(struct.pack('<QQIq', start, size, count,
+                                         last_id) + eids)
+
+            handle.write(struct.pack('<Q', pos) + self.MAGIC)
+
+            handle.flush()
+            if sync:
+                os.fsync(handle.fileno())
+
+        # The tables read from the old file keep its map, it's unmapped once
+        # they're gone
+        self._handle.close()
+        if os.name == 'nt':  # Can't replace mapped files
+            self._close_map()
+
+        replace(tmp_path, self._path)
+        self._open()
+
+    def _copy(self, handle, start, size, chunk_size=1024 * 1024):
+        for pos in range(start, start + size, chunk_size):
+            handle.write(self._data[pos:min(pos + chunk_size, start + size)])
+
+    def _write_records(self, handle, name, values, changed):
+        """
+        Write the records of a table.
+
+        Elements that didn't change (and weren't decoded, see
+        :class:`~tinydb.database.LazyElements`) are copied as they are.
+
+        :returns: the table's directory entry
+        """
+
+        entry = self._tables.get(name)
+        stored = entry.offsets() if entry is not None else {}
+
+        if changed is not None:
+            changed = set(changed)
+
+        decoded = getattr(values, 'decoded', None)
+
+        start = handle.tell()
+        eids = []
+        offsets = []
+
+        for key in values:
+            eid = int(key)
+            eids.append(eid)
+            offsets.append(handle.tell() - start)
+
+            if eid in stored and (
+                    changed is not None and eid not in changed or
+                    decoded is not None and not decoded(eid)):
+                pos = entry.start + stored[eid]
+                length, = struct.unpack_from('<I', self._data, pos)
+                handle.write(self._data[pos:pos + 4 + length])
+                continue
+
+            record = json.dumps(values[key], **self.kwargs)
+            if not isinstance(record, bytes):
+                record = record.encode('utf-8')
+            handle.write(struct.pack('<I', len(record)) + record)
+
+        count = len(eids)
+        return (name, start, handle.tell() - start, count, max(eids or [0]),
+                struct.pack('<{0}q{0}Q'.format(count), *(eids + offsets)))
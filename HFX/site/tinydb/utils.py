@@ -2,68 +2,277 @@
 Utility functions.
 """
 
+from collections import OrderedDict
 from contextlib import contextmanager
+from operator import methodcaller
+import re
+import sys
+import threading
 import warnings
 
-# Python 2/3 independant dict iteration
-iteritems = getattr(dict, 'iteritems', dict.items)
-itervalues = getattr(dict, 'itervalues', dict.values)
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:  # Python 2
+    from collections import Mapping, MutableMapping
 
+# Python 2/3 independant dict iteration, works for all mappings
+if hasattr(dict, 'iteritems'):
+    iteritems = methodcaller('iteritems')
+    itervalues = methodcaller('itervalues')
+else:
+    iteritems = methodcaller('items')
+    itervalues = methodcaller('values')
 
-class LRUCache(dict):
+# OrderedDict.move_to_end is missing on Python 2
+_move_to_end = getattr(OrderedDict, 'move_to_end', None)
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:  # Python 3
+    _STRING_TYPES = (str,)
+
+
+#: Returned by :func:`resolve_path` if the path doesn't exist
+MISSING = object()
+
+
+def resolve_path(value, path):
+    """
+    Follow a query path (a sequence of keys) into an element.
+
+    :returns: the value at the end of the path or :data:`MISSING`
+    """
+    try:
+        for part in path:
+            value = value[part]
+    except (KeyError, TypeError):
+        return MISSING
+
+    return value
+
+
+class LRUCache(MutableMapping):
     """
     A simple LRU cache.
+
+    Keeps the items in insertion order, so refreshing an item and removing
+    the least recently used one are O(1). The cache can be limited by the
+    number of items and by the (estimated) memory used by the values.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, capacity=None, max_bytes=None, sizeof=sys.getsizeof):
         """
         :param capacity: How many items to store before cleaning up old items
                          or ``None`` for an unlimited cache size
+        :param max_bytes: How many bytes the values may use before cleaning up
+                          old items or ``None`` for no limit
+        :param sizeof: The function used to estimate the size of a value
         """
 
-        self.capacity = kwargs.pop('capacity', None) or float('nan')
-        self.lru = []
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self.cache = OrderedDict()
+        self._sizes = {}
+
+        #: The estimated size of all values
+        self.bytes = 0
 
-        super(LRUCache, self).__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def refresh(self, key):
         """
         Push a key to the tail of the LRU queue
         """
-        if key in self.lru:
-            self.lru.remove(key)
-        self.lru.append(key)
-
-    def get(self, key, default=None):
-        item = super(LRUCache, self).get(key, default)
-        self.refresh(key)
-
-        return item
+        if _move_to_end is not None:
+            _move_to_end(self.cache, key)
+        else:
+            self.cache[key] = self.cache.pop(key)
 
     def __getitem__(self, key):
-        item = super(LRUCache, self).__getitem__(key)
+        try:
+            item = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
         self.refresh(key)
 
         return item
 
     def __setitem__(self, key, value):
-        super(LRUCache, self).__setitem__(key, value)
+        if key in self.cache:
+            self.bytes -= self._sizes[key]
 
+        self.cache[key] = value
         self.refresh(key)
 
+        self._sizes[key] = size = self.sizeof(value)
+        self.bytes += size
+
         # Check, if the cache is full and we have to remove old items
-        # If the queue is of unlimited size, self.capacity is NaN and
-        # x > NaN is always False in Python and the cache won't be cleared.
-        if len(self) > self.capacity:
-            self.pop(self.lru.pop(0))
+        while self.cache and (
+                (self.capacity and len(self.cache) > self.capacity) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            oldest = next(iter(self.cache))
+            del self[oldest]
+            self.evictions += 1
 
     def __delitem__(self, key):
-        super(LRUCache, self).__delitem__(key)
-        self.lru.remove(key)
+        del self.cache[key]
+        self.bytes -= self._sizes.pop(key)
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __iter__(self):
+        return iter(self.cache)
+
+    def __len__(self):
+        return len(self.cache)
 
     def clear(self):
-        super(LRUCache, self).clear()
-        del self.lru[:]
+        self.cache.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """
+        Get the cache's statistics.
+
+        :returns: the number of hits, misses and evictions, the hit rate,
+                  the number of cached items and their estimated size
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'items': len(self.cache),
+            'bytes': self.bytes,
+            'capacity': self.capacity,
+            'max_bytes': self.max_bytes,
+        }
+
+
+def compile_regex(pattern):
+    """
+    Compile a regular expression, reusing the compiled ones.
+
+    Unlike the cache of :mod:`re`, the cache is only used by the queries,
+    so running other regular expressions doesn't evict them.
+
+    :param pattern: the pattern or an already compiled pattern
+    """
+    if not isinstance(pattern, _STRING_TYPES):
+        return pattern
+
+    key = (type(pattern), pattern)
+
+    with _regex_lock:
+        compiled = _regex_cache.get(key)
+        if compiled is None:
+            compiled = _regex_cache[key] = re.compile(pattern)
+
+    return compiled
+
+
+class StringPool(object):
+    """
+    Replaces equal strings by a single object.
+
+    The JSON parser creates a new string for every value it reads, so a
+    table repeating the same status or user name keeps a copy per element.
+    Running the loaded elements through a pool keeps only the first copy:
+
+    >>> pool = StringPool()
+    >>> for row in rows:
+    ...     pool.intern(row)
+    >>> pool.saved  # The bytes used by the dropped copies
+    """
+
+    def __init__(self):
+        self._strings = {}
+
+        #: The bytes used by the copies that have been replaced
+        self.saved = 0
+
+    def __len__(self):
+        return len(self._strings)
+
+    def string(self, value):
+        """
+        Get the pooled copy of a string.
+        """
+        pooled = self._strings.setdefault(value, value)
+        if pooled is not value:
+            self.saved += sys.getsizeof(value)
+
+        return pooled
+
+    def intern(self, value):
+        """
+        Replace the strings in a value by their pooled copies.
+
+        Dicts (keys and values) and lists are changed in place, other
+        containers are left as they are.
+
+        :returns: the value or the pooled copy of a string
+        """
+        if isinstance(value, _STRING_TYPES):
+            return self.string(value)
+
+        if isinstance(value, list):
+            items = enumerate(value)
+        elif isinstance(value, dict) and not isinstance(value, FrozenDict):
+            items = iteritems(value)
+        else:
+            return value
+
+        # Runs for every element of a table, so the lookups are local
+        pool = self._strings.setdefault
+        sizeof = sys.getsizeof
+        strings = _STRING_TYPES
+        saved = 0
+        replace_keys = False
+
+        for key, item in items:
+            if type(key) in strings:
+                pooled = pool(key, key)
+                if pooled is not key:
+                    saved += sizeof(key)
+                    replace_keys = True
+
+            if type(item) in strings:
+                pooled = pool(item, item)
+                if pooled is not item:
+                    saved += sizeof(item)
+                    value[key] = pooled
+            elif isinstance(item, (dict, list)):
+                value[key] = self.intern(item)
+
+        self.saved += saved
+
+        if replace_keys:
+            # Keys can only be replaced by adding them again, the pooled
+            # ones have been added to the pool above
+            pairs = [(pool(key, key), item) for key, item in iteritems(value)]
+            value.clear()
+            value.update(pairs)
+
+        return value
+
+
+#: The compiled patterns of :func:`compile_regex`
+_regex_cache = LRUCache(capacity=512)
+_regex_lock = threading.Lock()
 
 
 # Source: https://github.com/PythonCharmers/python-future/blob/466bfb2dfa36d865285dc31fe2b0c0a53ff0f181/future/utils/__init__.py#L102-L134